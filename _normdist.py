@@ -0,0 +1,71 @@
+"""
+Standard normal distribution functions for the pricing hot path.
+* Scalar functions use math.erfc/exp and avoid scipy.stats entirely
+* The *_array functions use the scipy.special ufuncs (ndtr, ndtri), which
+  are what scipy.stats.norm calls after its argument checking
+* ex50/tests/test_normdist.py checks them against scipy.stats.norm
+"""
+
+from __future__ import division
+from math import erfc, exp, log, sqrt, pi
+import numpy as np
+from scipy.special import ndtr, ndtri
+
+SQRT2   = sqrt(2)
+SQRT2PI = sqrt(2 * pi)
+
+# Acklam's rational approximation to the inverse normal cdf
+__A = (-3.969683028665376e+01,  2.209460984245205e+02, -2.759285104469687e+02,
+        1.383577518672690e+02, -3.066479806614716e+01,  2.506628277459239e+00)
+__B = (-5.447609879822406e+01,  1.615858368580409e+02, -1.556989798598866e+02,
+        6.680131188771972e+01, -1.328068155288572e+01)
+__C = (-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00,
+       -2.549732539343734e+00,  4.374664141464968e+00,  2.938163982698783e+00)
+__D = ( 7.784695709041462e-03,  3.224671290700398e-01,  2.445134137142996e+00,
+        3.754408661907416e+00)
+__PLOW = 0.02425
+
+def norm_pdf(x):
+    return exp(-x*x/2) / SQRT2PI
+
+def norm_cdf(x):
+    return erfc(-x / SQRT2) / 2
+
+def norm_ppf(p):
+    if not 0 < p < 1:
+        if p == 0:
+            return float('-inf')
+        elif p == 1:
+            return float('inf')
+        return float('nan')
+
+    # 1 - p is exact above one half, so the lower tail carries the accuracy
+    if p > 0.5:
+        return -norm_ppf(1 - p)
+
+    a, b, c, d = __A, __B, __C, __D
+    if p < __PLOW:
+        q = sqrt(-2 * log(p))
+        x = ((((((c[0]*q + c[1])*q + c[2])*q + c[3])*q + c[4])*q + c[5])
+             / ((((d[0]*q + d[1])*q + d[2])*q + d[3])*q + 1))
+    else:
+        q = p - 0.5
+        r = q * q
+        x = ((((((a[0]*r + a[1])*r + a[2])*r + a[3])*r + a[4])*r + a[5]) * q
+             / (((((b[0]*r + b[1])*r + b[2])*r + b[3])*r + b[4])*r + 1))
+
+    # One Halley step brings the approximation to full double precision
+    e = norm_cdf(x) - p
+    u = e * SQRT2PI * exp(x*x/2)
+    return x - u / (1 + x*u/2)
+
+def norm_pdf_array(x):
+    x = np.asarray(x, dtype = float)
+    return np.exp(-x**2/2) / SQRT2PI
+
+def norm_cdf_array(x):
+    return ndtr(x)
+
+def norm_ppf_array(p):
+    return ndtri(p)
+
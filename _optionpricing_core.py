@@ -0,0 +1,620 @@
+"""
+Black Model equations for calculating option price and greeks.
+This is the shared pricing core; _optionpricing_dte, _tte and _yte are thin
+time convention adapters over it.
+* YTE is defined as YEARS to expiration
+* Theta and Charm are in years - divide by days per year (252 or 365)
+* Option type is 1/2 or 'C'/'P' in any case (see OTYPES)
+* Uses discounted futures price in place of spot price in BS model
+* Functions return None in event of an error
+* The *_array functions accept NumPy arrays and return arrays (nan on error)
+"""
+
+from __future__ import division
+from _normdist import norm_cdf, norm_pdf, norm_ppf, \
+                      norm_cdf_array, norm_pdf_array
+from math import log, sqrt, exp, pi
+import numpy as np
+
+try:
+    import optionpricing_kernel as _kernel
+except ImportError:
+    _kernel = None
+
+# The price, fused greeks and implied vol array functions run on the typed
+# kernel when it has been built; set to False to force the NumPy versions.
+USE_KERNEL = _kernel is not None
+
+CALL, PUT = 1, 2
+OTYPES    = {1: CALL, 2: PUT, 'C': CALL, 'P': PUT, 'c': CALL, 'p': PUT}
+
+def calc_d1(forward, strike, iv, yte):
+    d1 = log(forward/strike) / (iv * sqrt(yte)) \
+         + iv/2 * sqrt(yte)
+    return d1
+
+def calc_d2(forward, strike, iv, yte):
+    d2 = log(forward/strike) / (iv * sqrt(yte)) \
+         - iv/2 * sqrt(yte)
+    return d2
+    
+def calc_delta(forward, strike, iv, yte, oType):
+    oType = OTYPES.get(oType, oType)
+    
+    if iv == 0:
+        d1 = 1
+    else:
+        d1 = calc_d1(forward, strike, iv, yte)
+    
+    x1 = norm_cdf(d1)
+    
+    if oType == CALL:
+        delta = x1
+    elif oType == PUT:
+        delta = x1 - 1
+    else:
+        print 'Error - Option type not recognized: ', oType
+        return None
+    
+    return delta
+    
+def calc_gamma(forward, strike, iv, yte):
+    if iv <= 0 or yte <= 0:
+        gamma = 0
+    else:
+        d1 = calc_d1(forward, strike, iv, yte)
+        gamma = norm_pdf(d1) / (forward * iv * sqrt(yte))
+    
+    return gamma
+
+def calc_theta(forward, strike, iv, yte):
+    if iv <= 0 or yte <= 0:
+        theta = 0
+    else:
+        d1 = calc_d1(forward, strike, iv, yte)
+        theta = -forward * norm_pdf(d1) * iv / (2*sqrt(yte))
+        
+    return theta
+    
+def calc_vega(forward, strike, iv, yte):
+    if iv <= 0 or yte <= 0:
+        vega = 0
+    else:
+        d1 = calc_d1(forward, strike, iv, yte)
+        vega = forward * norm_pdf(d1) * sqrt(yte) / 100
+    
+    return vega
+    
+def calc_charm(forward, strike, iv, yte):
+    d1 = calc_d1(forward, strike, iv, yte)
+    d2 = calc_d2(forward, strike, iv, yte)
+    charm = -norm_pdf(d1) * (-d2 * iv * sqrt(yte)) \
+            / (2 * yte * iv* sqrt(yte))
+    return charm
+    
+def calc_deltatostrike(forward, delta, iv, yte, oType):
+    oType = OTYPES.get(oType, oType)
+    
+    if delta > 1:
+        delta = delta / 100
+    else:
+        delta = delta
+    
+    if oType == CALL:
+        delta = delta
+    elif oType == PUT:
+        delta = -delta
+    else:
+        print 'Error - Option Type not recognized: ', oType
+        return None
+    
+    strike = forward * exp(-iv * sqrt(yte) * (norm_ppf(delta) \
+             - iv * sqrt(yte) / 2))
+    
+    return strike
+
+def calc_intrinsic(forward, strike, oType):
+    oType = OTYPES.get(oType, oType)
+    
+    if oType == CALL:
+        if forward > strike:
+            intrinsic = forward - strike
+        else:
+            intrinsic = 0
+            
+    elif oType == PUT:
+        if forward < strike:
+            intrinsic = strike - forward
+        else:
+            intrinsic = 0
+            
+    else:
+        print 'Error - Option Type not recognized: ', oType
+        return None
+    
+    return intrinsic
+
+def calc_price(forward, strike, iv, yte, oType):
+    oType = OTYPES.get(oType, oType)
+    
+    if iv <= 0 or yte <= 0:
+        price = calc_intrinsic(forward, strike, oType)
+    else:
+        d1 = calc_d1(forward, strike, iv, yte)
+        d2 = calc_d2(forward, strike, iv, yte)
+        x1 = norm_cdf(d1)
+        x2 = norm_cdf(d2)
+        
+        if oType == CALL:
+            price = forward * x1 - strike * x2
+        elif oType == PUT:
+            price = strike * (1 - x2) - forward *(1 - x1)
+        else:
+            print 'Error - Option Type %r not recognized.' % oType
+            return None
+        
+    return price
+    
+def calc_forward(spotPrice, interestRate, divYield, yte):
+    forward = spotPrice * exp((interestRate - divYield) * yte)
+    return forward
+    
+def calc_impliedvol(forward, strike, yte, oType, actualPrice, 
+                    fullOutput = False):
+    """Solve for the implied volatility of a given option. Starts from the
+    Corrado-Miller approximation and takes Newton steps on vega, falling back
+    to bisection of the bracket [0, 10] whenever a step leaves it.
+    Returns the vol, or (vol, converged, nIter) if fullOutput is set."""
+    oType = OTYPES.get(oType, oType)
+    
+    if oType == CALL:
+        isCall = True
+    elif oType == PUT:
+        isCall = False
+    else:
+        print 'Error - Option Type %r not recognized.' % oType
+        return None
+    
+    tol = 0.0000000001
+    nIter = 0
+    converged = False
+    
+    volUB, volLB = 10, 0
+    if yte > 0:
+        vol = __impliedvol_guess(forward, strike, yte, isCall, actualPrice)
+    else:
+        # Expired: the guess is undefined and the price is intrinsic at
+        # any vol, so start from the middle of the bracket
+        vol = (volUB + volLB) / 2
+    if not volLB < vol < volUB:
+        vol = (volUB + volLB) / 2
+    
+    while nIter < 100:
+        price, vega = __price_vega(forward, strike, vol, yte, isCall)
+        nIter += 1
+        if abs(actualPrice - price) <= tol:
+            converged = True
+            break
+        
+        if price <= actualPrice:
+            volLB = vol
+        else:
+            volUB = vol
+        
+        if vega > 0:
+            vol = vol - (price - actualPrice) / vega
+        if not volLB < vol < volUB:
+            vol = (volUB + volLB) / 2
+    
+    if fullOutput:
+        return vol, converged, nIter
+    return vol
+
+def __price_vega(forward, strike, iv, yte, isCall):
+    """Black price and vega per unit of vol, sharing one d1/d2."""
+    if iv <= 0 or yte <= 0:
+        if isCall:
+            return max(forward - strike, 0), 0
+        return max(strike - forward, 0), 0
+    
+    sqrtT = sqrt(yte)
+    lnFK  = log(forward/strike) / (iv * sqrtT)
+    d1    = lnFK + iv/2 * sqrtT
+    d2    = lnFK - iv/2 * sqrtT
+    if isCall:
+        price = forward * norm_cdf(d1) - strike * norm_cdf(d2)
+    else:
+        price = strike * (1 - norm_cdf(d2)) - forward *(1 - norm_cdf(d1))
+    return price, forward * norm_pdf(d1) * sqrtT
+
+def __impliedvol_guess(forward, strike, yte, isCall, price):
+    """Corrado-Miller implied vol approximation for one option, yte > 0; puts
+    are converted to calls by put-call parity. nan if it is undefined."""
+    call = price if isCall else price + forward - strike
+    half = call - (forward - strike) / 2
+    if forward + strike == 0:
+        return float('nan')
+    root = sqrt(max(half**2 - (forward - strike)**2 / pi, 0))
+    return sqrt(2 * pi / yte) / (forward + strike) * (half + root)
+
+def __impliedvol_guess_array(forward, strike, yte, isCall, price):
+    """Corrado-Miller implied vol approximation on arrays, inf or nan where
+    it is undefined."""
+    call = np.where(isCall, price, price + forward - strike)
+    half = call - (forward - strike) / 2
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        root = np.sqrt(np.maximum(half**2 - (forward - strike)**2 / np.pi, 0))
+        vol  = np.sqrt(2 * np.pi / yte) / (forward + strike) * (half + root)
+    return vol
+
+## Array versions
+# Accept NumPy arrays or broadcastable scalars and return arrays. The zero
+# vol / expired branches are handled with masks; entries with an 
+# unrecognized option type are returned as nan.
+
+def kernel_inputs(*args):
+    """Broadcast to contiguous 1-D float64 arrays for the typed kernel.
+    Return the broadcast shape and the arrays."""
+    args = np.broadcast_arrays(*[np.asarray(x, dtype = float) for x in args])
+    return args[0].shape, [np.ascontiguousarray(x).ravel() for x in args]
+
+def normalize_otype_array(oType):
+    """Map an array of option types to the numeric codes; unrecognized types
+    map to 0. Numeric arrays are returned as they are, so normalizing a book
+    once up front lets every later call skip the string handling."""
+    oType = np.asarray(oType)
+    if oType.dtype.kind in 'SUO':
+        oType = np.char.upper(oType.astype(str))
+        oType = np.where(oType == 'C', CALL, np.where(oType == 'P', PUT, 0))
+    return oType
+
+def __otype_masks(oType):
+    oType = normalize_otype_array(oType)
+    return oType == CALL, oType == PUT
+
+def calc_d1_array(forward, strike, iv, yte):
+    forward, strike, iv, yte = [np.asarray(x, dtype = float) 
+                               for x in (forward, strike, iv, yte)]
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        d1 = np.log(forward/strike) / (iv * np.sqrt(yte)) \
+             + iv/2 * np.sqrt(yte)
+    return d1
+
+def calc_d2_array(forward, strike, iv, yte):
+    forward, strike, iv, yte = [np.asarray(x, dtype = float) 
+                               for x in (forward, strike, iv, yte)]
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        d2 = np.log(forward/strike) / (iv * np.sqrt(yte)) \
+             - iv/2 * np.sqrt(yte)
+    return d2
+
+def calc_delta_array(forward, strike, iv, yte, oType):
+    iv = np.asarray(iv, dtype = float)
+    d1 = np.where(iv == 0, 1, calc_d1_array(forward, strike, iv, yte))
+    x1 = norm_cdf_array(d1)
+    
+    isCall, isPut = __otype_masks(oType)
+    delta = np.where(isCall, x1, np.where(isPut, x1 - 1, np.nan))
+    return delta
+
+def calc_gamma_array(forward, strike, iv, yte):
+    forward, iv, yte = [np.asarray(x, dtype = float) 
+                          for x in (forward, iv, yte)]
+    d1 = calc_d1_array(forward, strike, iv, yte)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        gamma = norm_pdf_array(d1) / (forward * iv * np.sqrt(yte))
+    return np.where((iv <= 0) | (yte <= 0), 0, gamma)
+
+def calc_theta_array(forward, strike, iv, yte):
+    forward, iv, yte = [np.asarray(x, dtype = float) 
+                          for x in (forward, iv, yte)]
+    d1 = calc_d1_array(forward, strike, iv, yte)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        theta = -forward * norm_pdf_array(d1) * iv / (2*np.sqrt(yte))
+    return np.where((iv <= 0) | (yte <= 0), 0, theta)
+
+def calc_vega_array(forward, strike, iv, yte):
+    forward, iv, yte = [np.asarray(x, dtype = float) 
+                          for x in (forward, iv, yte)]
+    d1 = calc_d1_array(forward, strike, iv, yte)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        vega = forward * norm_pdf_array(d1) * np.sqrt(yte) / 100
+    return np.where((iv <= 0) | (yte <= 0), 0, vega)
+
+def calc_charm_array(forward, strike, iv, yte):
+    iv, yte = [np.asarray(x, dtype = float) for x in (iv, yte)]
+    d1 = calc_d1_array(forward, strike, iv, yte)
+    d2 = calc_d2_array(forward, strike, iv, yte)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        charm = -norm_pdf_array(d1) * (-d2 * iv * np.sqrt(yte)) \
+                / (2 * yte * iv* np.sqrt(yte))
+    return np.where((iv <= 0) | (yte <= 0), 0, charm)
+
+def calc_intrinsic_array(forward, strike, oType):
+    forward, strike = [np.asarray(x, dtype = float) for x in (forward, strike)]
+    isCall, isPut = __otype_masks(oType)
+    intrinsic = np.where(isCall, np.maximum(forward - strike, 0),
+                np.where(isPut,  np.maximum(strike - forward, 0), np.nan))
+    return intrinsic
+
+def calc_price_array(forward, strike, iv, yte, oType):
+    if USE_KERNEL:
+        shape, args = kernel_inputs(forward, strike, iv, yte, 
+                                      normalize_otype_array(oType))
+        price = np.empty(args[0].size)
+        _kernel.price_array(*(args + [price]))
+        return price.reshape(shape)
+    
+    forward, strike, iv, yte = [np.asarray(x, dtype = float) 
+                                for x in (forward, strike, iv, yte)]
+    d1 = calc_d1_array(forward, strike, iv, yte)
+    d2 = calc_d2_array(forward, strike, iv, yte)
+    x1 = norm_cdf_array(d1)
+    x2 = norm_cdf_array(d2)
+    
+    isCall, isPut = __otype_masks(oType)
+    price = np.where(isCall, forward * x1 - strike * x2,
+            np.where(isPut,  strike * (1 - x2) - forward *(1 - x1), np.nan))
+    
+    intrinsic = calc_intrinsic_array(forward, strike, oType)
+    return np.where((iv <= 0) | (yte <= 0), intrinsic, price)
+
+
+def calc_impliedvol_array(forward, strike, yte, oType, actualPrice, 
+                          tol = 0.0000000001, maxIter = 100):
+    """Array version of calc_impliedvol. Solves every option at once and
+    returns (vol, converged, nIter) arrays instead of printing; options with
+    an unrecognized type get a nan vol."""
+    if USE_KERNEL:
+        shape, args = kernel_inputs(forward, strike, yte, 
+                                      normalize_otype_array(oType), 
+                                      actualPrice)
+        vol       = np.empty(args[0].size)
+        converged = np.zeros(args[0].size, dtype = bool)
+        nIter     = np.zeros(args[0].size, dtype = np.intp)
+        _kernel.impliedvol_array(*(args + [tol, maxIter, vol, 
+                                 converged.view(np.uint8), nIter]))
+        return vol.reshape(shape), converged.reshape(shape), nIter.reshape(shape)
+    
+    forward, strike, yte, actualPrice = np.broadcast_arrays(
+        *[np.asarray(x, dtype = float) 
+          for x in (forward, strike, yte, actualPrice)])
+    isCall, isPut = [np.broadcast_to(x, forward.shape) 
+                     for x in __otype_masks(oType)]
+    
+    nIter     = np.zeros(forward.shape, dtype = int)
+    converged = np.zeros(forward.shape, dtype = bool)
+    volLB     = np.zeros(forward.shape)
+    volUB     = np.full(forward.shape, 10.0)
+    vol       = __impliedvol_guess_array(forward, strike, yte, isCall, 
+                                         actualPrice) * np.ones(forward.shape)
+    with np.errstate(invalid = 'ignore'):
+        vol[~((vol > volLB) & (vol < volUB))] = 5.0
+    
+    active = (isCall | isPut).copy()
+    while active.any() and nIter.max() < maxIter:
+        idx = np.flatnonzero(active)
+        F, K, T, target = (forward.flat[idx], strike.flat[idx], 
+                           yte.flat[idx], actualPrice.flat[idx])
+        v, lb, ub = vol.flat[idx], volLB.flat[idx], volUB.flat[idx]
+        
+        price, vega = __price_vega_array(F, K, v, T, isCall.flat[idx])
+        nIter.flat[idx] += 1
+        done = np.abs(target - price) <= tol
+        lb = np.where(price <= target, v, lb)
+        ub = np.where(price <= target, ub, v)
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            step = v - (price - target) / vega
+        step = np.where((step > lb) & (step < ub), step, (ub + lb) / 2)
+        
+        vol.flat[idx]       = np.where(done, v, step)
+        volLB.flat[idx]     = lb
+        volUB.flat[idx]     = ub
+        converged.flat[idx] = done
+        active.flat[idx]    = ~done
+    
+    vol[~(isCall | isPut)] = np.nan
+    return vol, converged, nIter
+
+def __price_vega_array(forward, strike, iv, yte, isCall):
+    """Array version of __price_vega."""
+    expired = (iv <= 0) | (yte <= 0)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        sqrtT = np.sqrt(yte)
+        lnFK  = np.log(forward/strike) / (iv * sqrtT)
+        d1    = lnFK + iv/2 * sqrtT
+        d2    = lnFK - iv/2 * sqrtT
+        x1    = norm_cdf_array(d1)
+        x2    = norm_cdf_array(d2)
+        price = np.where(isCall, forward * x1 - strike * x2,
+                         strike * (1 - x2) - forward *(1 - x1))
+        vega  = forward * norm_pdf_array(d1) * sqrtT
+    
+    intrinsic = np.where(isCall, np.maximum(forward - strike, 0),
+                         np.maximum(strike - forward, 0))
+    return (np.where(expired, intrinsic, price), np.where(expired, 0, vega))
+
+## Fused price and greeks
+# d1, d2 and the normal pdf/cdf are evaluated once and shared by every
+# output. For zero vol or expired options the price is intrinsic, delta is
+# the intrinsic delta and the remaining greeks are zero.
+
+def calc_all(forward, strike, iv, yte, oType):
+    """Return (price, delta, gamma, vega, theta, charm) for one option."""
+    oType = OTYPES.get(oType, oType)
+    
+    if oType == CALL:
+        isCall = True
+    elif oType == PUT:
+        isCall = False
+    else:
+        print 'Error - Option Type %r not recognized.' % oType
+        return None
+    
+    if iv <= 0 or yte <= 0:
+        price = calc_intrinsic(forward, strike, oType)
+        if isCall:
+            delta = 1 if forward > strike else 0
+        else:
+            delta = -1 if forward < strike else 0
+        return price, delta, 0, 0, 0, 0
+    
+    sqrtT = sqrt(yte)
+    lnFK  = log(forward/strike) / (iv * sqrtT)
+    d1    = lnFK + iv/2 * sqrtT
+    d2    = lnFK - iv/2 * sqrtT
+    pdf1  = norm_pdf(d1)
+    x1    = norm_cdf(d1)
+    x2    = norm_cdf(d2)
+    
+    if isCall:
+        price = forward * x1 - strike * x2
+        delta = x1
+    else:
+        price = strike * (1 - x2) - forward *(1 - x1)
+        delta = x1 - 1
+    
+    gamma = pdf1 / (forward * iv * sqrtT)
+    vega  = forward * pdf1 * sqrtT / 100
+    theta = -forward * pdf1 * iv / (2*sqrtT)
+    charm = -pdf1 * (-d2 * iv * sqrtT) / (2 * yte * iv* sqrtT)
+    return price, delta, gamma, vega, theta, charm
+
+def calc_all_array(forward, strike, iv, yte, oType):
+    """Array version of calc_all. Returns a tuple of arrays."""
+    if USE_KERNEL:
+        shape, args = kernel_inputs(forward, strike, iv, yte, 
+                                      normalize_otype_array(oType))
+        out = np.empty((6, args[0].size))
+        _kernel.all_array(*(args + [out]))
+        return tuple(x.reshape(shape) for x in out)
+    
+    forward, strike, iv, yte = [np.asarray(x, dtype = float) 
+                                for x in (forward, strike, iv, yte)]
+    isCall, isPut = __otype_masks(oType)
+    expired = (iv <= 0) | (yte <= 0)
+    
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        sqrtT = np.sqrt(yte)
+        lnFK  = np.log(forward/strike) / (iv * sqrtT)
+        d1    = lnFK + iv/2 * sqrtT
+        d2    = lnFK - iv/2 * sqrtT
+        pdf1  = norm_pdf_array(d1)
+        x1    = norm_cdf_array(d1)
+        x2    = norm_cdf_array(d2)
+        
+        price = np.where(isCall, forward * x1 - strike * x2,
+                np.where(isPut,  strike * (1 - x2) - forward *(1 - x1), np.nan))
+        delta = np.where(isCall, x1, np.where(isPut, x1 - 1, np.nan))
+        gamma = pdf1 / (forward * iv * sqrtT)
+        vega  = forward * pdf1 * sqrtT / 100
+        theta = -forward * pdf1 * iv / (2*sqrtT)
+        charm = -pdf1 * (-d2 * iv * sqrtT) / (2 * yte * iv* sqrtT)
+    
+    intrinsicDelta = np.where(isCall, (forward > strike).astype(float),
+                     np.where(isPut, -(forward < strike).astype(float), np.nan))
+    price = np.where(expired, calc_intrinsic_array(forward, strike, oType), price)
+    delta = np.where(expired, intrinsicDelta, delta)
+    gamma = np.where(expired, 0, gamma)
+    vega  = np.where(expired, 0, vega)
+    theta = np.where(expired, 0, theta)
+    charm = np.where(expired, 0, charm)
+    return price, delta, gamma, vega, theta, charm
+
+
+## Time conventions
+
+class DayCountConvention(object):
+    """Core functions taking time to expiration in days instead of years.
+    Theta and Charm are returned per day."""
+    def __init__(self, daysPerYear):
+        self.daysPerYear = daysPerYear
+    
+    def __years(self, days):
+        if isinstance(days, (list, tuple)):
+            days = np.asarray(days, dtype = float)
+        return days / self.daysPerYear
+    
+    def calc_d1(self, forward, strike, iv, dte):
+        return calc_d1(forward, strike, iv, self.__years(dte))
+    
+    def calc_d2(self, forward, strike, iv, dte):
+        return calc_d2(forward, strike, iv, self.__years(dte))
+    
+    def calc_delta(self, forward, strike, iv, dte, oType):
+        return calc_delta(forward, strike, iv, self.__years(dte), oType)
+    
+    def calc_gamma(self, forward, strike, iv, dte):
+        return calc_gamma(forward, strike, iv, self.__years(dte))
+    
+    def calc_theta(self, forward, strike, iv, dte):
+        return (calc_theta(forward, strike, iv, self.__years(dte)) 
+                / self.daysPerYear)
+    
+    def calc_vega(self, forward, strike, iv, dte):
+        return calc_vega(forward, strike, iv, self.__years(dte))
+    
+    def calc_charm(self, forward, strike, iv, dte):
+        return (calc_charm(forward, strike, iv, self.__years(dte)) 
+                / self.daysPerYear)
+    
+    def calc_deltatostrike(self, forward, delta, iv, dte, oType):
+        return calc_deltatostrike(forward, delta, iv, self.__years(dte), 
+                                  oType)
+    
+    def calc_price(self, forward, strike, iv, dte, oType):
+        return calc_price(forward, strike, iv, self.__years(dte), oType)
+    
+    def calc_forward(self, spotPrice, interestRate, divYield, dte):
+        return calc_forward(spotPrice, interestRate, divYield, 
+                            self.__years(dte))
+    
+    def calc_impliedvol(self, forward, strike, dte, oType, actualPrice, 
+                        fullOutput = False):
+        return calc_impliedvol(forward, strike, self.__years(dte), oType, 
+                               actualPrice, fullOutput)
+    
+    def calc_all(self, forward, strike, iv, dte, oType):
+        result = calc_all(forward, strike, iv, self.__years(dte), oType)
+        if result is None:
+            return None
+        price, delta, gamma, vega, theta, charm = result
+        return (price, delta, gamma, vega, theta / self.daysPerYear, 
+                charm / self.daysPerYear)
+    
+    def calc_d1_array(self, forward, strike, iv, dte):
+        return calc_d1_array(forward, strike, iv, self.__years(dte))
+    
+    def calc_d2_array(self, forward, strike, iv, dte):
+        return calc_d2_array(forward, strike, iv, self.__years(dte))
+    
+    def calc_delta_array(self, forward, strike, iv, dte, oType):
+        return calc_delta_array(forward, strike, iv, self.__years(dte), oType)
+    
+    def calc_gamma_array(self, forward, strike, iv, dte):
+        return calc_gamma_array(forward, strike, iv, self.__years(dte))
+    
+    def calc_theta_array(self, forward, strike, iv, dte):
+        return (calc_theta_array(forward, strike, iv, self.__years(dte)) 
+                / self.daysPerYear)
+    
+    def calc_vega_array(self, forward, strike, iv, dte):
+        return calc_vega_array(forward, strike, iv, self.__years(dte))
+    
+    def calc_charm_array(self, forward, strike, iv, dte):
+        return (calc_charm_array(forward, strike, iv, self.__years(dte)) 
+                / self.daysPerYear)
+    
+    def calc_price_array(self, forward, strike, iv, dte, oType):
+        return calc_price_array(forward, strike, iv, self.__years(dte), oType)
+    
+    def calc_impliedvol_array(self, forward, strike, dte, oType, actualPrice,
+                              tol = 0.0000000001, maxIter = 100):
+        return calc_impliedvol_array(forward, strike, self.__years(dte), 
+                                     oType, actualPrice, tol, maxIter)
+    
+    def calc_all_array(self, forward, strike, iv, dte, oType):
+        price, delta, gamma, vega, theta, charm = calc_all_array(
+            forward, strike, iv, self.__years(dte), oType)
+        return (price, delta, gamma, vega, theta / self.daysPerYear, 
+                charm / self.daysPerYear)
@@ -1,17 +1,123 @@
+"""
+MAC margin service.
+* POST /margin with a position .csv (Content-Type text/csv) or JSON, either
+  {"positions": [{"Strike": ..., "C/P": ..., ...}, ...]} or a bare list,
+  using the .csv column names; returns the margin as JSON
+* The pricing stack is imported and warmed up once, at startup
+* Results are cached by a hash of the parsed portfolio, so a resubmitted
+  book is answered without repricing; option reprices are shared across
+  books through a shockcache.ShockCache, which locks only its own lookups
+  and inserts, so requests are margined concurrently
+* Bad input, including an unrecognized C/P, is answered with a 400
+* Usage: python bin/app.py [port], from the ex50 directory
+"""
+
+import os
+import sys
+import json
+import hashlib
+import threading
+from collections import OrderedDict
 import web
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+	'..', '..'))
+import macmargin as mm
+import positions
+import shockcache
+
+RESULT_CACHE_SIZE = 1024
+
 urls = (
-	'/', 'index'
+	'/', 'index',
+	'/margin', 'margin'
 )
 
+# Debug mode reloads changed modules on every request
+web.config.debug = False
+
 app = web.application(urls, globals())
 
 render = web.template.render('templates/')
 
+results     = OrderedDict()
+shockCache  = shockcache.ShockCache()
+cacheLock   = threading.Lock()
+
+POSITION_TYPES = set([1, 2, 3, 4])
+
+
+def warm_up():
+	"""Import and exercise the whole margin path once."""
+	book = positions.records_to_positions([
+		{'C/P': 3, 'Quantity': 1, 'Theo Price': 100, 'DTE': 30,
+		 'Multiplier': 1},
+		{'Strike': 100, 'C/P': 1, 'Quantity': 1, 'Implied Vol': 0.2,
+		 'Theo Price': 100, 'Delta': 0.5, 'Vega': 0.1, 'DTE': 30,
+		 'Forward': 100, 'Multiplier': 100}])
+	mm.calc_margin_result(book)
+
+
+def read_portfolio(data, contentType):
+	if 'csv' in contentType:
+		portfolio = positions.parse_positions(data)
+	else:
+		payload = json.loads(data)
+		if isinstance(payload, dict):
+			payload = payload['positions']
+		portfolio = positions.records_to_positions(payload)
+	if not set(portfolio['CP'].tolist()) <= POSITION_TYPES:
+		raise Exception('Position type not recognized.')
+	return portfolio
+
+
+def calc_margin(portfolio):
+	"""MAC margin of a parsed portfolio as a dict, from the result cache if
+	the same book was margined before."""
+	key = hashlib.sha1(portfolio.tostring()).hexdigest()
+	with cacheLock:
+		summary = results.pop(key, None)
+		if summary is not None:
+			results[key] = summary
+			return dict(summary, Cached = True)
+
+	clean  = mm.check_for_expiring(portfolio)
+	result = mm.calc_margin_result(clean, cache = shockCache)
+	summary = {'Positions'     : int(clean.shape[0]),
+	           'Price_Risk'    : float(result.priceRisk),
+	           'Worst_Bucket'  : float(result.worstBucket),
+	           'Vol_Risk'      : float(result.volRisk),
+	           'Vega_Liq_Risk' : float(result.vegaLiqRisk),
+	           'MAC_Margin'    : float(result.macMargin)}
+
+	with cacheLock:
+		results[key] = summary
+		while len(results) > RESULT_CACHE_SIZE:
+			results.popitem(last = False)
+	return dict(summary, Cached = False)
+
+
 class index:
 	def GET(self):
 		greeting = "Hello World"
 		return render.index(greeting = greeting)
 
+
+class margin:
+	def POST(self):
+		web.header('Content-Type', 'application/json')
+		try:
+			portfolio = read_portfolio(web.data(),
+				web.ctx.env.get('CONTENT_TYPE', ''))
+		except Exception as e:
+			raise web.badrequest(json.dumps({'Error': str(e)}))
+		try:
+			summary = calc_margin(portfolio)
+		except Exception as e:
+			raise web.internalerror(json.dumps({'Error': str(e)}))
+		return json.dumps(summary)
+
+
 if __name__ == "__main__":
-	app.run()
\ No newline at end of file
+	warm_up()
+	app.run()
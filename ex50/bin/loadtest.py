@@ -0,0 +1,95 @@
+"""
+Load test for the margin service in app.py.
+* POSTs a position .csv to /margin from several threads and reports the
+  p50/p90/p99 latency and the throughput
+* With distinct, every request changes the stock line's quantity so the
+  service's result cache cannot answer it (the shock cache still can)
+* Usage: python bin/loadtest.py <position .csv> [requests] [threads]
+         [distinct] [url, default http://localhost:8080/margin]
+"""
+
+import sys
+import time
+import json
+import threading
+import urllib2
+import numpy as np
+
+
+def make_bodies(path_to_csv, nRequests, distinct):
+	with open(path_to_csv, 'rU') as inFile:
+		lines = inFile.read().splitlines()
+	if not distinct:
+		return ['\n'.join(lines)] * nRequests
+
+	# The stock line's Quantity (4th column) is bumped by the request number
+	bodies  = []
+	stockNo = [i for i, line in enumerate(lines) if line.split(',')[2] == '3']
+	for n in range(nRequests):
+		copy = list(lines)
+		for i in stockNo:
+			cells    = copy[i].split(',')
+			cells[3] = repr(float(cells[3]) + n)
+			copy[i]  = ','.join(cells)
+		bodies.append('\n'.join(copy))
+	return bodies
+
+
+def run(url, bodies, nThreads):
+	"""Send bodies from nThreads threads. Return (latencies in seconds,
+	number answered from the result cache, errors, wall time)."""
+	latencies, cached, errors = [], [0], []
+	queue = list(reversed(bodies))
+	lock  = threading.Lock()
+
+	def worker():
+		while True:
+			with lock:
+				if not queue:
+					return
+				body = queue.pop()
+			request = urllib2.Request(url, body,
+				{'Content-Type': 'text/csv'})
+			time1 = time.time()
+			try:
+				reply = json.loads(urllib2.urlopen(request).read())
+			except Exception as e:
+				with lock:
+					errors.append(str(e))
+				continue
+			time2 = time.time()
+			with lock:
+				latencies.append(time2 - time1)
+				cached[0] += reply.get('Cached', False)
+
+	threads = [threading.Thread(target = worker) for i in range(nThreads)]
+	time1 = time.time()
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	return latencies, cached[0], errors, time.time() - time1
+
+
+if __name__ == "__main__":
+	args      = sys.argv[1:]
+	urls      = [a for a in args if a.startswith('http')]
+	url       = urls[0] if urls else 'http://localhost:8080/margin'
+	distinct  = 'distinct' in args
+	args      = [a for a in args if a != 'distinct' and a not in urls]
+	fileName  = args[0]
+	nRequests = int(args[1]) if len(args) > 1 else 1000
+	nThreads  = int(args[2]) if len(args) > 2 else 4
+
+	bodies = make_bodies(fileName, nRequests, distinct)
+	latencies, cached, errors, wall = run(url, bodies, nThreads)
+
+	ms = np.array(latencies) * 1000
+	print '%d requests, %d threads, %d errors, %d from the result cache.' % (
+		nRequests, nThreads, len(errors), cached)
+	if len(ms):
+		print 'p50 %.2f ms  p90 %.2f ms  p99 %.2f ms  max %.2f ms' % tuple(
+			np.percentile(ms, [50, 90, 99, 100]))
+		print '%.0f requests/s.' % (len(ms) / wall)
+	for error in sorted(set(errors)):
+		print 'Error: %s' % error
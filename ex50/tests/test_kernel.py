@@ -0,0 +1,79 @@
+"""
+Agreement of the typed kernel (optionpricing_kernel) with the NumPy array
+functions of the pricing core.
+* Skipped unless the kernel has been built: python setup.py build_ext
+  --inplace, from the repository root
+* Usage: python -m unittest discover -s ex50/tests, from the repository root
+"""
+
+import os
+import sys
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', '..'))
+import _optionpricing_core as core
+
+RTOL = 1e-9
+ATOL = 1e-9
+
+
+@unittest.skipIf(core._kernel is None, 'optionpricing_kernel is not built')
+class KernelTests(unittest.TestCase):
+    # Zero and negative vols and expiries, and unrecognized option types,
+    # are in the mix
+    rng     = np.random.RandomState(0)
+    n       = 100000
+    forward = rng.uniform(500, 3000, n)
+    strike  = forward * rng.uniform(0.3, 1.7, n)
+    iv      = rng.uniform(-0.05, 1.5, n)
+    yte     = rng.uniform(-0.02, 3, n)
+    oType   = rng.choice(['C', 'P', 'c', 'p', 'X'], n)
+
+    def setUp(self):
+        self.useKernel = core.USE_KERNEL
+
+    def tearDown(self):
+        core.USE_KERNEL = self.useKernel
+
+    def both(self, calc):
+        """calc() with the kernel, then with the NumPy versions."""
+        results = []
+        for useKernel in (True, False):
+            core.USE_KERNEL = useKernel
+            results.append(calc())
+        return results
+
+    def check(self, kernel, numpy, name = ''):
+        np.testing.assert_allclose(np.asarray(kernel, dtype = float),
+                                   np.asarray(numpy, dtype = float),
+                                   rtol = RTOL, atol = ATOL, err_msg = name)
+
+    def test_price(self):
+        self.check(*self.both(lambda: core.calc_price_array(self.forward,
+                   self.strike, self.iv, self.yte, self.oType)))
+
+    def test_all(self):
+        kernel, numpy = self.both(lambda: core.calc_all_array(self.forward,
+                        self.strike, self.iv, self.yte, self.oType))
+        for name, ours, theirs in zip(['price', 'delta', 'gamma', 'vega',
+                                       'theta', 'charm'], kernel, numpy):
+            self.check(ours, theirs, name)
+
+    def test_impliedvol(self):
+        yte   = np.abs(self.yte) + 0.001
+        price = core.calc_price_array(self.forward, self.strike,
+                                      np.abs(self.iv) + 0.01, yte, self.oType)
+        kernel, numpy = self.both(lambda: core.calc_impliedvol_array(
+                        self.forward, self.strike, yte, self.oType, price))
+        # Vols of options with almost no vega are not unique, so compare
+        # the repriced options rather than the vols themselves
+        reprice = lambda vol: core.calc_price_array(self.forward, self.strike,
+                                                    vol, yte, self.oType)
+        self.check(reprice(kernel[0]), reprice(numpy[0]))
+        self.check(kernel[1], numpy[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
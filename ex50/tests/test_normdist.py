@@ -0,0 +1,57 @@
+"""
+Accuracy of _normdist against scipy.stats.norm.
+* Usage: python -m unittest discover -s ex50/tests, from the repository root
+"""
+
+import os
+import sys
+import unittest
+import numpy as np
+from scipy.stats import norm
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', '..'))
+from _normdist import norm_pdf, norm_cdf, norm_ppf, \
+                      norm_pdf_array, norm_cdf_array, norm_ppf_array
+
+# Relative tolerance, and the absolute one for values near zero
+RTOL = 1e-11
+ATOL = 1e-15
+
+
+class NormDistTests(unittest.TestCase):
+    # Deep into both tails, where the cdf is denormal or within an ulp of 1
+    x = np.linspace(-38, 38, 200001)
+    p = np.concatenate([np.logspace(-300, -1, 50000),
+                        np.linspace(0.1, 0.9, 50001),
+                        1 - np.logspace(-1, -15, 50000)])
+
+    def check(self, ours, ref):
+        np.testing.assert_allclose(ours, ref, rtol = RTOL, atol = ATOL)
+
+    def test_norm_pdf(self):
+        self.check([norm_pdf(v) for v in self.x], norm.pdf(self.x))
+
+    def test_norm_cdf(self):
+        self.check([norm_cdf(v) for v in self.x], norm.cdf(self.x))
+
+    def test_norm_ppf(self):
+        self.check([norm_ppf(v) for v in self.p], norm.ppf(self.p))
+
+    def test_norm_ppf_limits(self):
+        self.assertEqual(norm_ppf(0), float('-inf'))
+        self.assertEqual(norm_ppf(1), float('inf'))
+        self.assertTrue(np.isnan(norm_ppf(1.5)))
+
+    def test_norm_pdf_array(self):
+        self.check(norm_pdf_array(self.x), norm.pdf(self.x))
+
+    def test_norm_cdf_array(self):
+        self.check(norm_cdf_array(self.x), norm.cdf(self.x))
+
+    def test_norm_ppf_array(self):
+        self.check(norm_ppf_array(self.p), norm.ppf(self.p))
+
+
+if __name__ == '__main__':
+    unittest.main()
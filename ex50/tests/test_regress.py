@@ -0,0 +1,59 @@
+"""
+The golden-file regression checks of macregress under unittest: every
+margin engine against the exported book's committed risk files, and a
+small generated book, with and without repeated lines, against the
+original row-by-row loop; and the nonExpiredPosition artifact, which
+must read back as a position file.
+* Usage: python -m unittest discover -s ex50/tests, from the repository root
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+sys.path.insert(0, ROOT)
+import macregress
+import macmargin as mm
+import positions
+
+
+class RegressTests(unittest.TestCase):
+    def test_golden_book(self):
+        portfolio, reference = macregress.load_golden(
+                               os.path.join(ROOT, macregress.GOLDEN_BOOK))
+        self.assertEqual(macregress.check_book(portfolio, reference,
+                                               macregress.GOLDEN_BOOK), 0)
+
+    def test_generated_book(self):
+        portfolio = macregress.generated_book(300)
+        self.assertEqual(macregress.check_book(portfolio,
+                         macregress.python_engine(portfolio),
+                         'generated book'), 0)
+
+    def test_repeated_lines(self):
+        portfolio = macregress.with_repeated_lines(
+                    macregress.generated_book(300))
+        self.assertEqual(macregress.check_book(portfolio,
+                         macregress.python_engine(portfolio),
+                         'generated book with repeated lines'), 0)
+
+    def test_position_artifact(self):
+        directory = tempfile.mkdtemp()
+        try:
+            portfolio = mm.getPortfolio(
+                        os.path.join(ROOT, macregress.GOLDEN_BOOK),
+                        mm.CsvWriter(directory))[0]
+            written   = positions.read_positions(
+                        os.path.join(directory, 'nonExpiredPosition.csv'))
+        finally:
+            shutil.rmtree(directory)
+        for field in portfolio.dtype.names:
+            np.testing.assert_array_equal(written[field], portfolio[field])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+"""
+Opt-in instrumentation for margin runs.
+* A Recorder collects the wall time and number of calls of each stage, plus
+  named counts (pricing calls, options priced, cache hits, ...)
+* Pass one as recorder to macmargin.calc_margin_summary and friends; without
+  one they use NULL_RECORDER, which records nothing
+* emit() returns the run's record as a dict and, given a stream, writes it
+  as one JSON line
+* merge() adds in another Recorder's timings and counts, e.g. of the blocks
+  of a chunked run priced on other threads; stage times are then summed
+  over the threads, not wall time
+"""
+
+
+from __future__ import division
+import json
+import time
+from collections import OrderedDict
+
+
+class Recorder(object):
+    """Stage timings and counts of one margin run."""
+    def __init__(self, stream = None, **fields):
+        self.stream = stream
+        self.fields = fields
+        self.stages = OrderedDict()
+        self.counts = OrderedDict()
+        self.start  = time.time()
+
+    def stage(self, name):
+        """Context manager timing one pass through stage name."""
+        return _Stage(self, name)
+
+    def add_time(self, name, seconds):
+        stage = self.stages.setdefault(name, {'seconds' : 0, 'calls' : 0})
+        stage['seconds'] += seconds
+        stage['calls']   += 1
+
+    def count(self, name, n = 1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def merge(self, other):
+        for name, stage in other.stages.items():
+            mine = self.stages.setdefault(name, {'seconds' : 0, 'calls' : 0})
+            mine['seconds'] += stage['seconds']
+            mine['calls']   += stage['calls']
+        for name, n in other.counts.items():
+            self.count(name, n)
+
+    def emit(self, **fields):
+        """Return the record of the run; write it to stream as a JSON line
+        if there is one."""
+        record = OrderedDict([('time', time.strftime('%Y-%m-%dT%H:%M:%S',
+                                        time.localtime(self.start))),
+                              ('seconds', time.time() - self.start)])
+        record.update(sorted(self.fields.items()))
+        record.update(sorted(fields.items()))
+        record['stages'] = self.stages
+        record['counts'] = self.counts
+        if self.stream is not None:
+            self.stream.write(json.dumps(record) + '\n')
+            self.stream.flush()
+        return record
+
+
+class _Stage(object):
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name     = name
+
+    def __enter__(self):
+        self.time1 = time.time()
+
+    def __exit__(self, *excInfo):
+        self.recorder.add_time(self.name, time.time() - self.time1)
+
+
+class NullRecorder(object):
+    """Stands in for a Recorder when a run is not instrumented."""
+    def stage(self, name):
+        return _NULL_STAGE
+
+    def add_time(self, name, seconds):
+        pass
+
+    def count(self, name, n = 1):
+        pass
+
+    def merge(self, other):
+        pass
+
+    def emit(self, **fields):
+        return None
+
+
+class _NullStage(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *excInfo):
+        pass
+
+_NULL_STAGE   = _NullStage()
+NULL_RECORDER = NullRecorder()
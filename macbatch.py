@@ -0,0 +1,144 @@
+"""
+Calculates MAC margin requirements for many portfolio files at once.
+* Position files are fanned out over a process pool; each worker imports and
+  warms up the pricing stack once and then margins file after file
+* With outDir, each file's priceRisk/volRisk/vegaLiqRisk artifacts are
+  written to its own sub-directory of it, so accounts with the same
+  timestamp do not clash; by default nothing but the summary is written
+* Each worker keeps a shockcache.ShockCache of option reprices shared by all
+  the files it margins; with cachePath the cache is loaded from and saved to
+  disk, so later runs on the same day start warm
+* With recordPath every file's stage timings are appended to that file as a
+  JSON line, see instrument.Recorder
+* Usage: python macbatch.py <directory or glob> [summary.csv] [processes]
+         [cache file] [artifact directory]
+"""
+
+
+from __future__ import division
+import sys
+import os
+import glob
+import csv
+import multiprocessing
+from multiprocessing.util import Finalize
+import numpy as np
+import macmargin as mm
+import _optionpricing_dte as bs
+import shockcache
+import instrument
+
+SUMMARY_FIELDS = ['File', 'Timestamp', 'Price_Risk', 'Worst_Bucket',
+                  'Vol_Risk', 'Vega_Liq_Risk', 'MAC_Margin', 'Cache_Hits',
+                  'Cache_Misses', 'Error']
+
+# The worker's shock cache, set by __init_worker
+__cache = None
+
+
+def find_position_files(pattern):
+    """Accept a directory (searched for position_*.csv) or a glob pattern.
+    Return the sorted list of matching files."""
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, 'position_*.csv')
+    return sorted(glob.glob(pattern))
+
+
+def calc_margin_batch(fileNames, processes = None, outDir = None,
+                      cacheSize = 100000, cachePath = None, 
+                      recordPath = None):
+    """Margin every file over a pool of processes (default: one per CPU).
+    Return one summary dict per file, in the order given. A file that fails
+    gets nan risk figures and the error message instead of stopping the
+    batch. cacheSize = 0 turns the shock cache off."""
+    if outDir is not None:
+        outDir = os.path.abspath(outDir)
+    if cachePath is not None:
+        cachePath = os.path.abspath(cachePath)
+    if recordPath is not None:
+        recordPath = os.path.abspath(recordPath)
+    tasks = [(os.path.abspath(f), outDir, recordPath) for f in fileNames]
+    pool  = multiprocessing.Pool(processes, initializer = __init_worker,
+                                 initargs = (cacheSize, cachePath))
+    try:
+        summaries = pool.map(__margin_file, tasks, chunksize = 1)
+    finally:
+        pool.close()
+        pool.join()
+    return summaries
+
+
+def write_summary(summaries, outFileName):
+    """Write the per-file summaries as a .csv table."""
+    with open(outFileName, 'wb') as outFile:
+        writer = csv.DictWriter(outFile, SUMMARY_FIELDS)
+        writer.writeheader()
+        for summary in summaries:
+            writer.writerow(summary)
+
+
+def __init_worker(cacheSize, cachePath):
+    # Price one option so the compiled kernel and NumPy are loaded before
+    # the first file arrives
+    bs.calc_price_array(np.ones(1), np.ones(1), 0.2, 30, 1)
+
+    global __cache
+    if cacheSize > 0:
+        __cache = shockcache.ShockCache(cacheSize, cachePath)
+        if cachePath is not None:
+            Finalize(__cache, __cache.save, args = (cachePath,),
+                     exitpriority = 10)
+
+
+def __margin_file(task):
+    fileName, outDir, recordPath = task
+    hits, misses = (__cache.hits, __cache.misses) if __cache is not None \
+                   else (0, 0)
+    try:
+        writer = None
+        if outDir is not None:
+            writer = mm.CsvWriter(os.path.join(outDir,
+                     os.path.splitext(os.path.basename(fileName))[0]))
+        if recordPath is None:
+            summary = mm.calc_margin_summary(fileName, writer, __cache)
+        else:
+            # One write per record, so lines from the workers do not mix
+            with open(recordPath, 'a', 0) as recordFile:
+                recorder = instrument.Recorder(recordFile, 
+                                               pid = os.getpid())
+                summary  = mm.calc_margin_summary(fileName, writer, __cache,
+                                                  recorder)
+        summary['Error'] = ''
+    except Exception as e:
+        summary = dict((field, np.nan) for field in SUMMARY_FIELDS)
+        summary.update(File = fileName, Timestamp = '', Error = str(e))
+    if __cache is not None:
+        summary.update(Cache_Hits   = __cache.hits - hits,
+                       Cache_Misses = __cache.misses - misses)
+    else:
+        summary.update(Cache_Hits = 0, Cache_Misses = 0)
+    return summary
+
+
+## Main
+if __name__ == '__main__':
+    args        = sys.argv[1:]
+    pattern     = args[0]
+    outFileName = args[1] if len(args) > 1 else 'marginSummary.csv'
+    processes   = int(args[2]) if len(args) > 2 else None
+    cachePath   = args[3] if len(args) > 3 else None
+    outDir      = args[4] if len(args) > 4 else None
+
+    fileNames = find_position_files(pattern)
+    print 'Calculating margin for %d position files.' % len(fileNames)
+    summaries = calc_margin_batch(fileNames, processes, outDir,
+                                  cachePath = cachePath)
+    write_summary(summaries, outFileName)
+
+    for summary in summaries:
+        if summary['Error']:
+            print 'Failed %s: %s' % (summary['File'], summary['Error'])
+    print 'Shock cache hits: %d, misses: %d.' % (
+          sum(s['Cache_Hits'] for s in summaries),
+          sum(s['Cache_Misses'] for s in summaries))
+    print 'Summary written to %r.' % outFileName
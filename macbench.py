@@ -0,0 +1,236 @@
+"""
+Benchmarks the pricing and margin hot paths on synthetic books.
+* Books of 1k/10k/100k positions are generated in the position_s12_*.csv
+  schema: one stock line plus options priced with the library itself
+* Each benchmark runs in a forked process; its time is the best of several
+  runs and its memory how far the runs push the process's peak RSS above
+  what loading the book took
+* Scalar functions are timed on at most SCALAR_SAMPLE options
+* Results are saved as JSON together with the git revision, so runs of two
+  versions can be compared with: python macbench.py compare old new
+* Usage: python macbench.py [results.json] [positions ...]
+"""
+
+
+from __future__ import division
+import sys
+import os
+import json
+import time
+import platform
+import resource
+import subprocess
+import tempfile
+import multiprocessing
+import numpy as np
+import macmargin as mm
+import _optionpricing_dte as bs
+import _optionpricing_core
+
+
+SIZES         = [1000, 10000, 100000]
+SCALAR_SAMPLE = 2000
+MIN_TIME      = 0.5
+MAX_REPEATS   = 5
+
+HEADER = ['Exp Date', 'Strike', 'C/P', 'Quantity', 'Implied Vol',
+          'Theo Price', 'Delta', 'Gamma', 'Vega', 'Theta', 'Charm', 'OEV',
+          'Bid', 'Ask', 'TTE', 'DTE', 'Forward', 'Multiplier', 'Spot']
+
+
+def make_book(nPos, path, seed = 0, forward = 2192.13):
+    """Write a book of nPos positions (one stock line, the rest options) to
+    path in the position export schema. nPos can be up to 560k."""
+    rng    = np.random.RandomState(seed)
+    nOpt   = nPos - 1
+
+    # Distinct (DTE, Strike, C/P) contracts, as in a real export
+    days    = np.arange(1, 801) + 0.35
+    strikes = np.arange(0.6 * forward // 5, 1.4 * forward // 5 + 1) * 5
+    pick    = rng.choice(len(days) * len(strikes) * 2, nOpt, replace = False)
+    dte     = days[pick // (2 * len(strikes))]
+    strike  = strikes[pick // 2 % len(strikes)]
+    cp      = pick % 2 + 1
+    iv     = rng.uniform(0.08, 0.6, nOpt)
+    qty    = rng.randint(-500, 501, nOpt)
+    price, delta, gamma, vega, theta, charm = bs.calc_all_array(forward,
+                                              strike, iv, dte, cp)
+    # Quote at least one tick: a zero Theo Price cannot be repriced, since
+    # the margin calculation uses it as the forward
+    price = np.maximum(price, 0.05)
+
+    with open(path, 'w') as outFile:
+        outFile.write(','.join(HEADER) + '\n')
+        outFile.write(',,3,%r,,%r,,,,,,,,,1,1000,,1,%r\n' % (
+                      float(-qty.sum()), forward / 10, forward))
+        for i in xrange(nOpt):
+            outFile.write('%d,%r,%d,%d,%r,%r,%r,%r,%r,%r,%r,%r,%r,%r,%r,'
+                          '%r,%r,100,%r\n' % (42706 + dte[i], strike[i],
+                          cp[i], qty[i], iv[i], price[i], delta[i], gamma[i],
+                          vega[i], theta[i], charm[i], price[i],
+                          max(price[i] - 0.05, 0), price[i] + 0.05,
+                          dte[i] / 365, dte[i], forward, forward))
+
+
+def define_benchmarks(path):
+    """(name, setup) pairs; setup() returns (function, options per call)."""
+    def options():
+        portfolio, fieldNames, timestamp = mm.getPortfolio(path)
+        return portfolio, portfolio[(portfolio['CP'] == 1)
+                                    | (portfolio['CP'] == 2)]
+
+    def price_array():
+        p, o = options()
+        return (lambda: bs.calc_price_array(o['Forward'], o['Strike'],
+                o['Implied_Vol'], o['DTE'], o['CP'])), o.shape[0]
+
+    def greeks_array():
+        p, o = options()
+        return (lambda: bs.calc_all_array(o['Forward'], o['Strike'],
+                o['Implied_Vol'], o['DTE'], o['CP'])), o.shape[0]
+
+    def impliedvol_array():
+        p, o = options()
+        return (lambda: bs.calc_impliedvol_array(o['Forward'], o['Strike'],
+                o['DTE'], o['CP'], o['Theo_Price'])), o.shape[0]
+
+    def scalar(f):
+        def setup():
+            p, o = options()
+            rows = [tuple(row) for row in o[['Forward', 'Strike',
+                    'Implied_Vol', 'DTE', 'CP', 'Theo_Price']]
+                    [:SCALAR_SAMPLE]]
+            return (lambda: [f(*row) for row in rows]), len(rows)
+        return setup
+
+    def price(F, K, v, t, c, p):
+        return bs.calc_price(F, K, v, t, c)
+
+    def greeks(F, K, v, t, c, p):
+        return bs.calc_all(F, K, v, t, c)
+
+    def impliedvol(F, K, v, t, c, p):
+        return bs.calc_impliedvol(F, K, t, c, p)
+
+    def pricerisk():
+        p, o = options()
+        return (lambda: mm.calc_pricerisk(p, '')), o.shape[0]
+
+    def volrisk():
+        p, o = options()
+        return (lambda: mm.calc_volrisk(p, '')), o.shape[0]
+
+    def margin():
+        p, o = options()
+        return (lambda: mm.calc_margin_summary(path)), o.shape[0]
+
+    return [('calc_price',            scalar(price)),
+            ('calc_all',              scalar(greeks)),
+            ('calc_impliedvol',       scalar(impliedvol)),
+            ('calc_price_array',      price_array),
+            ('calc_all_array',        greeks_array),
+            ('calc_impliedvol_array', impliedvol_array),
+            ('calc_pricerisk',        pricerisk),
+            ('calc_volrisk',          volrisk),
+            ('calc_margin_summary',   margin)]
+
+
+def run_benchmark(setup):
+    """Time setup's function. Return (best seconds, repeats, options per
+    call, growth of the peak RSS over the setup's, in MB)."""
+    f, nOptions = setup()
+    rss0 = __peak_rss()
+    times = []
+    while len(times) < MAX_REPEATS and (not times or sum(times) < MIN_TIME):
+        time1 = time.time()
+        f()
+        times.append(time.time() - time1)
+    return min(times), len(times), nOptions, (__peak_rss() - rss0) / 1024
+
+
+def __peak_rss():
+    # kB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def __run_in_child(setup):
+    parent, child = multiprocessing.Pipe(duplex = False)
+
+    def target():
+        child.send(run_benchmark(setup))
+
+    process = multiprocessing.Process(target = target)
+    process.start()
+    result = parent.recv()
+    process.join()
+    return result
+
+
+def run_suite(sizes = SIZES):
+    """Run every benchmark on a book of each size. Return a list of result
+    dicts."""
+    results = []
+    for nPos in sizes:
+        path = tempfile.mktemp(prefix = 'position_bench_', suffix = '.csv')
+        make_book(nPos, path)
+        try:
+            for name, setup in define_benchmarks(path):
+                best, repeats, nOptions, memory = __run_in_child(setup)
+                results.append({'benchmark'     : name,
+                                'positions'     : nPos,
+                                'options'       : nOptions,
+                                'repeats'       : repeats,
+                                'seconds'       : best,
+                                'optionsPerSec' : nOptions / best,
+                                'peakMemoryMB'  : memory})
+                print '%-22s %7d positions %10.3f ms %14.0f options/s '\
+                      '%8.1f MB' % (name, nPos, best * 1000,
+                      nOptions / best, memory)
+        finally:
+            os.remove(path)
+    return results
+
+
+def describe_environment():
+    try:
+        revision = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                   cwd = os.path.dirname(os.path.abspath(__file__)),
+                   stderr = open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = ''
+    return {'revision' : revision,
+            'date'     : time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python'   : platform.python_version(),
+            'numpy'    : np.__version__,
+            'machine'  : platform.machine(),
+            'kernel'   : _optionpricing_core.USE_KERNEL}
+
+
+def compare(oldFileName, newFileName):
+    """Print the speed-up of every benchmark from one results file to
+    another."""
+    with open(oldFileName) as oldFile, open(newFileName) as newFile:
+        old, new = json.load(oldFile), json.load(newFile)
+    oldTimes = dict(((r['benchmark'], r['positions']), r['seconds'])
+                    for r in old['results'])
+    for r in new['results']:
+        key = (r['benchmark'], r['positions'])
+        if key in oldTimes:
+            print '%-22s %7d positions %8.2fx' % (key + (oldTimes[key]
+                  / r['seconds'],))
+
+
+## Main
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if args and args[0] == 'compare':
+        compare(args[1], args[2])
+    else:
+        outFileName = args[0] if args else 'benchmark.json'
+        sizes       = [int(x) for x in args[1:]] or SIZES
+        results     = run_suite(sizes)
+        with open(outFileName, 'w') as outFile:
+            json.dump({'environment' : describe_environment(),
+                       'results'     : results}, outFile, indent = 1,
+                      sort_keys = True)
+        print 'Results written to %r.' % outFileName
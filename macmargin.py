@@ -1,5 +1,17 @@
 """
 Calculates MAC margin requirements for a portfolio.
+* Importable: calc_margin_result returns every result in memory
+* Artifacts (priceRisk, volRisk, vegaLiqRisk, nonExpiredPosition) are only
+  saved when a writer is passed; any object with write(name, array) will do
+* Pass an instrument.Recorder as recorder to time each stage of a run
+* Pass a pricegrid.PriceGrid as priceGrid to reprice options by
+  interpolation instead of exactly (for very large books); make_price_grid
+  builds one over the moneyness this calculation prices at
+* Repeated lines of one contract (e.g. from several sub-accounts) are netted
+  before pricing, so each distinct contract is repriced once
+* calc_margin_chunked works through very large books in blocks of lines on
+  a thread pool, in memory bounded by the block size
+* Usage: python macmargin.py <position .csv> writes them as .csv as before
 """
 
 
@@ -7,33 +19,242 @@ from __future__ import division
 import sys
 import os.path
 import numpy as np
-import optionpricing_dte as bs
+import _optionpricing_dte as bs
+import positions
+import instrument
+import pricegrid
 import time
-from math import sqrt
+from collections import namedtuple
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 
 
-def calc_pricerisk(portfolio, timestamp):
+MarginResult = namedtuple('MarginResult', 
+    ['timestamp', 'priceRisk', 'worstBucket', 'volRisk', 'vegaLiqRisk', 
+     'macMargin', 'priceShocks', 'priceRiskMatrix', 'volRiskVector', 
+     'vegaLiqRiskVector'])
+
+MarginCurve = namedtuple('MarginCurve', 
+    ['daysForward', 'priceRisk', 'worstBucket', 'volRisk', 'vegaLiqRisk', 
+     'macMargin'])
+
+
+class CsvWriter(object):
+    """Save artifacts as .csv text. Risk arrays are written as they always
+    were; a portfolio (nonExpiredPosition) only holds the margin columns,
+    not the export's full set, so it gets a header row of their export
+    names and reads back with positions.read_positions."""
+    def __init__(self, directory = '.'):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+    
+    def write(self, name, array):
+        path = os.path.join(self.directory, name + '.csv')
+        if array.dtype.names is None:
+            np.savetxt(path, array, delimiter = ',')
+        else:
+            headers = dict((field, header) for header, field, fmt
+                           in positions.MARGIN_COLUMNS)
+            np.savetxt(path, array, delimiter = ',', comments = '',
+                       header = ','.join(headers.get(field, field)
+                                         for field in array.dtype.names))
+    
+    def open_rows(self, name, shape):
+        """Start an artifact of the given shape that is written a block of
+        rows at a time: returns an object with write(rows) and close()."""
+        return _CsvRows(os.path.join(self.directory, name + '.csv'))
+
+
+class NpyWriter(CsvWriter):
+    """Save artifacts as binary .npy files; far cheaper than formatting text
+    for large books. Read back with np.load."""
+    def write(self, name, array):
+        np.save(os.path.join(self.directory, name + '.npy'), array)
+    
+    def open_rows(self, name, shape):
+        return _NpyRows(os.path.join(self.directory, name + '.npy'), shape)
+
+
+class _CsvRows(object):
+    def __init__(self, path):
+        self.outFile = open(path, 'w')
+    
+    def write(self, rows):
+        np.savetxt(self.outFile, rows, delimiter = ',')
+    
+    def close(self):
+        self.outFile.close()
+
+
+class _NpyRows(object):
+    def __init__(self, path, shape):
+        self.array = np.lib.format.open_memmap(path, 'w+', float, shape)
+        self.nRows = 0
+    
+    def write(self, rows):
+        self.array[self.nRows:self.nRows + rows.shape[0]] = rows
+        self.nRows += rows.shape[0]
+    
+    def close(self):
+        self.array.flush()
+        del self.array
+
+
+def calc_margin_result(portfolio, timestamp = '', writer = None, 
+                       cache = None, recorder = None, priceGrid = None):
+    """Accept a portfolio. Calculate price, vol and vega liquidity risk and
+    the MAC margin. Return a MarginResult holding the totals and the 
+    per-position arrays. Option reprices are looked up in cache (see
+    shockcache.ShockCache) or interpolated in priceGrid (see 
+    pricegrid.PriceGrid) when one is given."""
+    if recorder is None:
+        recorder = instrument.NULL_RECORDER
+    priceShocks, nShocks = define_priceshocks()
+    
+    if cache is not None:
+        hits, misses = cache.hits, cache.misses
+    with recorder.stage('netting'):
+        netting = net_contracts(portfolio)
+    with recorder.stage('priceRisk'):
+        priceRisk = calc_pricerisk_matrix(portfolio, priceShocks, cache,
+                                          priceGrid, netting, recorder)
+    with recorder.stage('volRisk'):
+        volRisk, vegaLiqRisk = calc_volrisk_vectors(portfolio)
+    
+    if cache is not None:
+        recorder.count('cacheHits',   cache.hits - hits)
+        recorder.count('cacheMisses', cache.misses - misses)
+    recorder.count('positions', portfolio.shape[0])
+    recorder.count('contracts', netting[0].shape[0])
+    
+    if writer is not None:
+        with recorder.stage('output'):
+            writer.write('priceRisk'   + timestamp, priceRisk)
+            writer.write('volRisk'     + timestamp, volRisk)
+            writer.write('vegaLiqRisk' + timestamp, vegaLiqRisk)
+    
+    with recorder.stage('aggregation'):
+        portfolioPriceRisk, worstBucket    = __reduce__pricerisk(priceRisk, 
+                                                                 priceShocks)
+        portfolioVolRisk, portfolioLiqRisk = __reduce__volrisk(volRisk, 
+                                                               vegaLiqRisk)
+        macMargin = (portfolioPriceRisk + portfolioVolRisk[0] 
+                     + portfolioLiqRisk[0])
+    
+    return MarginResult(timestamp, portfolioPriceRisk, worstBucket, 
+                        portfolioVolRisk[0], portfolioLiqRisk[0], macMargin, 
+                        priceShocks, priceRisk, volRisk, vegaLiqRisk)
+
+
+CHUNK_SIZE = 65536
+
+def calc_margin_chunked(portfolio, timestamp = '', writer = None, 
+                        priceGrid = None, chunkSize = CHUNK_SIZE, 
+                        threads = None, keepRows = False, recorder = None):
+    """calc_margin_result for books too large to hold every position's
+    rows: blocks of chunkSize lines are priced on a pool of threads (the
+    pricing releases the GIL) and reduced to running shock totals and vol
+    and vega liquidity sums. The per-position arrays are written by writer
+    a block at a time, and kept in the MarginResult only if keepRows; 
+    otherwise they are None. Memory is O(threads * chunkSize). A recorder
+    gets the same stages and counts as from calc_margin_result, the block
+    stages summed over the threads."""
+    if recorder is None:
+        recorder = instrument.NULL_RECORDER
+    priceShocks, nShocks = define_priceshocks()
+    cp = portfolio['CP']
+    if not np.all((cp == 1) | (cp == 2) | (cp == 3) | (cp == 4)):
+        raise Exception('Position type not recognized.')
+    
+    nPos    = portfolio.shape[0]
+    shapes  = [('priceRisk', (nPos, nShocks)), ('volRisk', (nPos, 1)),
+               ('vegaLiqRisk', (nPos, 1))]
+    threads = threads or multiprocessing.cpu_count()
+    kept    = [np.empty(shape) for name, shape in shapes] if keepRows else []
+    outputs = [] if writer is None else [writer.open_rows(name + timestamp, 
+                                         shape) for name, shape in shapes]
+    
+    def margin_chunk(start):
+        # Each block records on its own Recorder, merged in order below
+        chunk    = portfolio[start:start + chunkSize]
+        blockRec = instrument.Recorder()
+        with blockRec.stage('netting'):
+            netting = net_contracts(chunk)
+        with blockRec.stage('priceRisk'):
+            rows = (calc_pricerisk_matrix(chunk, priceShocks, 
+                                          priceGrid = priceGrid, 
+                                          netting = netting,
+                                          recorder = blockRec),)
+        with blockRec.stage('volRisk'):
+            rows += calc_volrisk_vectors(chunk)
+        blockRec.count('contracts', netting[0].shape[0])
+        sums  = (rows[0].sum(axis = 0), rows[1].sum(), rows[2].sum(), 
+                 np.abs(rows[2]).sum())
+        return sums, rows if kept or outputs else None, blockRec
+    
+    # A wave of one block per thread at a time keeps memory bounded and
+    # the blocks written in order
+    totalPriceRisk = np.zeros(nShocks)
+    volTotal = netLiq = grossLiq = 0
+    pool = ThreadPool(threads)
+    try:
+        starts = range(0, nPos, chunkSize)
+        for wave in range(0, len(starts), threads):
+            waveStarts = starts[wave:wave + threads]
+            for start, (sums, rows, blockRec) in zip(waveStarts, 
+                                                     pool.map(margin_chunk, 
+                                                              waveStarts)):
+                recorder.merge(blockRec)
+                totalPriceRisk += sums[0]
+                volTotal       += sums[1]
+                netLiq         += sums[2]
+                grossLiq       += sums[3]
+                for array, block in zip(kept, rows or []):
+                    array[start:start + block.shape[0]] = block
+                if outputs:
+                    with recorder.stage('output'):
+                        for output, block in zip(outputs, rows):
+                            output.write(block)
+    finally:
+        pool.close()
+        for output in outputs:
+            output.close()
+    
+    recorder.count('positions', nPos)
+    with recorder.stage('aggregation'):
+        worstIdx  = np.argmin(totalPriceRisk)
+        liqRisk   = max(abs(netLiq), 0.2 * grossLiq)
+        macMargin = totalPriceRisk[worstIdx] + volTotal + liqRisk
+    priceRisk, volRisk, vegaLiqRisk = kept or [None] * 3
+    return MarginResult(timestamp, totalPriceRisk[worstIdx], 
+                        priceShocks[worstIdx], volTotal, liqRisk, macMargin,
+                        priceShocks, priceRisk, volRisk, vegaLiqRisk)
+
+
+def calc_pricerisk(portfolio, timestamp, writer = None, cache = None, 
+                   priceGrid = None):
     """Accept a portfolio. Calculate MAC price risk.
-    Return an array: rows = positions, cols = price shocks.
-    Save array as a .csv"""
-    priceShocks, nShocks = __define__priceshocks()
-                    
-    nPos = portfolio.shape[0]
-    priceRisk = np.zeros((nPos, nShocks))
-    
-    for row in range(0, nPos):
-        pos = portfolio[:][row]
-        
-        for col in range(0, nShocks):
-            shock = priceShocks[col]
-            
-            if pos['CP'] == 3 or pos['CP'] == 4:
-                priceRisk[row, col] = __stock__pricerisk(pos, shock)
-            elif pos['CP'] == 1 or pos['CP'] == 2:
-                priceRisk[row, col] = __option__pricerisk(pos, shock)
-            else:
-                raise Exception('Position type not recognized.')
-                
+    Return the portfolio price risk and the worst price shock bucket.
+    The array (rows = positions, cols = price shocks) is saved by writer.
+    With priceGrid the options are repriced approximately, to within
+    priceGrid.maxError times the shocked price of the underlying."""
+    priceShocks, nShocks = define_priceshocks()
+    
+    if writer is None:
+        # Only the totals are needed: work on the netted book
+        contracts = net_contracts(portfolio)[0]
+        priceRisk = calc_pricerisk_matrix(contracts, priceShocks, cache, 
+                                          priceGrid, (contracts, None))
+    else:
+        priceRisk = calc_pricerisk_matrix(portfolio, priceShocks, cache, 
+                                          priceGrid)
+        writer.write('priceRisk' + timestamp, priceRisk)
+    
+    return __reduce__pricerisk(priceRisk, priceShocks)
+
+
+def __reduce__pricerisk(priceRisk, priceShocks):
     totalPriceRisk = priceRisk.sum(axis = 0)
     worstIdx = np.argmin(totalPriceRisk)
     worstBucket = priceShocks[worstIdx]
@@ -41,56 +262,209 @@ def calc_pricerisk(portfolio, timestamp):
     
     # print 'The worst price shock bucket is %r.' % worstBucket
     
-    np.savetxt('priceRisk' + timestamp + '.csv' , priceRisk, delimiter = ',')
     return portfolioPriceRisk, worstBucket
-      
-                
-def __stock__pricerisk(pos, shock):
-    newPrice = pos['Theo_Price'] * (1 + shock)
-    pnl      = (pos['Multiplier'] * pos['Quantity']
-               * (newPrice - pos['Theo_Price']))
-    return pnl
 
 
-def __option__pricerisk(pos, shock):
-    newForward = pos['Theo_Price'] * (1 + shock)
-    newPrice   = bs.calc_price(newForward, pos['Strike'], 
-                 pos['Implied_Vol'], pos['DTE'], pos['CP'])
-    pnl        = (pos['Multiplier'] * pos['Quantity']
-                 * (newPrice - pos['Theo_Price']))
+def calc_pricerisk_matrix(portfolio, priceShocks, cache = None, 
+                          priceGrid = None, netting = None, recorder = None):
+    """Accept a portfolio and a list of price shocks. Return the P&L of every
+    position under every shock in one pass: rows = positions, 
+    cols = price shocks. Each distinct contract is repriced once; netting
+    is net_contracts(portfolio) if it is already at hand (a None row index
+    means the portfolio is netted already)."""
+    contracts, rowContract = netting or net_contracts(portfolio)
+    moves = calc_price_moves(contracts, priceShocks, cache, priceGrid, 
+                             recorder)
+    if rowContract is not None:
+        moves = moves[rowContract]
+    pnl = ((portfolio['Multiplier'] * portfolio['Quantity'])[:, np.newaxis]
+           * moves)
     return pnl
 
 
-def __define__priceshocks():
-    priceShocks = [-0.20, -0.175, -0.15, -0.125, -0.10, -0.08,
-                   -0.06,  -0.04, -0.03,  -0.02, -0.01,     0, 
-                    0.01,   0.02,  0.03,   0.04,  0.06, 
-                    0.08,   0.10, 0.125,   0.15, 0.175,  0.20]
-    return priceShocks, len(priceShocks)
+NETTING_FIELDS = ['DTE', 'Strike', 'CP', 'Theo_Price', 'Implied_Vol', 
+                  'Multiplier']
+__NETTING_HASH = np.array([-7046029254386353131, -4417276706812531889,
+                           1609587929392839161,   2870177450012600261,
+                           -8796714831421723037, -49064778989728563],
+                          dtype = np.int64)
+
+def net_contracts(portfolio):
+    """Accept a portfolio. Return (contracts, rowContract): one row per
+    distinct contract, in order of first appearance and with the quantities
+    of its lines summed, and the index of each line's contract, so that
+    contracts[rowContract] lines up with portfolio. Lines net only when they
+    match on NETTING_FIELDS, i.e. reprice identically under the same
+    multiplier; the other columns are taken from the first line. A book with
+    no repeated contracts is returned as it is, not copied, with a None
+    rowContract."""
+    # Lines are grouped on the bits of their key fields: sorting one hash
+    # of them is far cheaper than a sort on six columns. Equal keys hash
+    # equal; a colliding key can at worst split a contract in two.
+    bits = np.column_stack([portfolio[name].astype(float) 
+                            for name in NETTING_FIELDS]).view(np.int64)
+    lineOrder = np.argsort((bits * __NETTING_HASH).sum(axis = 1), 
+                           kind = 'mergesort')
+    bits = bits[lineOrder]
+    new  = np.ones(bits.shape[0], dtype = bool)
+    new[1:] = (bits[1:] != bits[:-1]).any(axis = 1)
+    if new.all():
+        return portfolio, None
+    
+    first = lineOrder[new]
+    order = np.argsort(first)
+    rank  = np.empty_like(order)
+    rank[order] = np.arange(order.shape[0])
+    rowContract = np.empty_like(lineOrder)
+    rowContract[lineOrder] = rank[np.cumsum(new) - 1]
+    
+    contracts = portfolio[first[order]]
+    contracts['Quantity'] = np.bincount(rowContract, 
+                                        weights = portfolio['Quantity'],
+                                        minlength = order.shape[0])
+    return contracts, rowContract
+
+
+def calc_price_moves(portfolio, priceShocks, cache = None, priceGrid = None,
+                     recorder = None):
+    """Accept a portfolio and a list of price shocks. Return the change in 
+    price of one unit of each position under every shock: 
+    rows = positions, cols = price shocks. A recorder counts the calls to
+    the option pricing (pricingCalls) and the prices they work out 
+    (optionsPriced)."""
+    if recorder is None:
+        recorder = instrument.NULL_RECORDER
+    cp       = portfolio['CP']
+    isStock  = (cp == 3) | (cp == 4)
+    isOption = (cp == 1) | (cp == 2)
+    if not np.all(isStock | isOption):
+        raise Exception('Position type not recognized.')
+    if cache is not None and priceGrid is not None:
+        raise Exception('Approximate prices cannot be cached.')
+    
+    shocks   = 1 + np.asarray(priceShocks, dtype = float)
+    theo     = portfolio['Theo_Price'][:, np.newaxis]
+    newPrice = theo * shocks
+    
+    moves  = newPrice - theo
+    optIdx = np.flatnonzero(isOption)
+    if priceGrid is not None:
+        calc = lambda options, priceShocks: __grid_moves(options, 
+                                                         priceShocks, priceGrid)
+    else:
+        calc = __option_moves
+    calc = __counted(calc, recorder)
+    if cache is None:
+        moves[optIdx] = calc(portfolio[optIdx], priceShocks)
+    else:
+        moves[optIdx] = cache.price_moves(portfolio[optIdx], priceShocks, 
+                                          calc)
+    return moves
+
+
+def __counted(calc, recorder):
+    # calc, counting its calls that price anything on recorder
+    def counted(options, priceShocks):
+        if options.shape[0]:
+            recorder.count('pricingCalls')
+            recorder.count('optionsPriced', options.shape[0] 
+                                            * len(priceShocks))
+        return calc(options, priceShocks)
+    return counted
+
+
+def __option_moves(options, priceShocks):
+    shocks   = 1 + np.asarray(priceShocks, dtype = float)
+    theo     = options['Theo_Price'][:, np.newaxis]
+    newPrice = bs.calc_price_array(theo * shocks, 
+                                   options['Strike'][:, np.newaxis],
+                                   options['Implied_Vol'][:, np.newaxis],
+                                   options['DTE'][:, np.newaxis],
+                                   options['CP'][:, np.newaxis])
+    return newPrice - theo
+
+
+def __grid_moves(options, priceShocks, priceGrid):
+    newPrice = priceGrid.calc_shocked_price_array(options['Theo_Price'], 
+               priceShocks, options['Strike'], options['Implied_Vol'], 
+               options['DTE'] / bs.DAYS_PER_YEAR, options['CP'])
+    return newPrice - options['Theo_Price'][:, np.newaxis]
+
+
+def make_price_grid(portfolio, nK = 1201, nW = 800):
+    """Build a pricegrid.PriceGrid spanning the options of portfolio under
+    the MAC price shocks. Prices are moved off Theo_Price as the forward, so
+    strikes are many times the forward and the default grid, around the
+    money, would price almost every option exactly."""
+    priceShocks, nShocks = define_priceshocks()
+    options = portfolio[(portfolio['CP'] == 1) | (portfolio['CP'] == 2)]
+    return pricegrid.grid_covering(options['Theo_Price'], priceShocks,
+           options['Strike'], options['Implied_Vol'],
+           options['DTE'] / bs.DAYS_PER_YEAR, nK, nW)
+
+
+PRICE_SHOCKS = [-0.20, -0.175, -0.15, -0.125, -0.10, -0.08,
+                -0.06,  -0.04, -0.03,  -0.02, -0.01,     0, 
+                 0.01,   0.02,  0.03,   0.04,  0.06, 
+                 0.08,   0.10, 0.125,   0.15, 0.175,  0.20]
+
+def define_priceshocks():
+    """The MAC price shocks, as a new list, and their number."""
+    return list(PRICE_SHOCKS), len(PRICE_SHOCKS)
        
                 
-def calc_volrisk(portfolio, timestamp):
+def calc_volrisk(portfolio, timestamp, writer = None):
     """Accept a portfolio. Calculate MAC volatility and vega liquidity risk.
-    Return an 1-D array: rows = positions."""
+    The per-position arrays are saved by writer."""
+    volRisk, vegaLiqRisk = calc_volrisk_vectors(portfolio)
+    if writer is not None:
+        writer.write('volRisk'     + timestamp, volRisk)
+        writer.write('vegaLiqRisk' + timestamp, vegaLiqRisk)
+    
+    return __reduce__volrisk(volRisk, vegaLiqRisk)
+
+
+def calc_volrisk_vectors(portfolio):
+    """Accept a portfolio. Return the vol risk and vega liquidity risk of
+    each position as (nPos, 1) arrays."""
+    isOption, shock, liqShift = calc_volshifts(portfolio)
+    
     nPos        = portfolio.shape[0]
     volRisk     = np.zeros((nPos, 1))
     vegaLiqRisk = np.zeros((nPos, 1))
     
-    for row in range(0, nPos):
-        pos = portfolio[:][row]
-        
-        if pos['CP'] == 3 or pos['CP'] == 4:
-            volRisk[row]        = 0
-            vegaLiqRisk[row, :] = 0
-        elif pos['CP'] == 1 or pos['CP'] == 2:
-            volRisk[row]     = __volrisk(pos)
-            vegaLiqRisk[row] = __vegaliqrisk(pos)
-        else:
-            raise Exception('Position type not recognized.')
-                
-    np.savetxt('volRisk'     + timestamp + '.csv' , volRisk,     delimiter = ',')
-    np.savetxt('vegaLiqRisk' + timestamp + '.csv' , vegaLiqRisk, delimiter = ',')
+    opt = portfolio[isOption]
+    volRisk[isOption, 0]     = np.abs(opt['Quantity'] * opt['Vega'] 
+                                      * shock[isOption] 
+                                      * opt['Implied_Vol'] * 100)
+    vegaLiqRisk[isOption, 0] = (opt['Quantity'] * opt['Vega'] 
+                                * liqShift[isOption])
+    return volRisk, vegaLiqRisk
+
+
+def calc_volshifts(portfolio):
+    """Accept a portfolio. Return a mask of the option positions and, for
+    those, the vol shock and the liquidity shift (capped at 2); both are 
+    zero for stock lines."""
+    cp       = portfolio['CP']
+    isStock  = (cp == 3) | (cp == 4)
+    isOption = (cp == 1) | (cp == 2)
+    if not np.all(isStock | isOption):
+        raise Exception('Position type not recognized.')
+    
+    shock    = np.zeros(portfolio.shape[0])
+    liqShift = np.zeros(portfolio.shape[0])
     
+    opt       = portfolio[isOption]
+    liqCharge = calc_volliquiditycharge(opt['Forward'], opt['Strike'])
+    shock[isOption]    = calc_volshock(opt['DTE'])
+    liqShift[isOption] = np.minimum(2, np.abs(shock[isOption] 
+                                              * opt['Implied_Vol'] 
+                                              * liqCharge * 100))
+    return isOption, shock, liqShift
+
+
+def __reduce__volrisk(volRisk, vegaLiqRisk):
     portfolioVolRisk = volRisk.sum(axis = 0)
     
     netVegaLiqRisk   = abs(vegaLiqRisk.sum(axis = 0))
@@ -100,61 +474,62 @@ def calc_volrisk(portfolio, timestamp):
     return portfolioVolRisk, portfolioLiqRisk
 
 
-def __volrisk(pos):
-    shock = __volshock(pos)
-    pnl   = abs(pos['Quantity'] * pos['Vega'] * shock * pos['Implied_Vol'] * 100)
-    return pnl
-    
-    
-def __vegaliqrisk(pos):
-    liqShift    = __volliquidityshift(pos)
-    netLiqRisk  = pos['Quantity'] * pos['Vega'] * liqShift
-    return netLiqRisk
-    
-    
-def __volliquidityshift(pos):
-    shock     = __volshock(pos)
-    liqCharge = __volliquiditycharge(pos)
-    liqShift  = min(2, abs(shock * pos['Implied_Vol'] * liqCharge * 100))
-    return liqShift
-    
-
-def __volshock(pos):
-    monToExp = 12 * pos['DTE']/365
-    shock    = 0.35 * sqrt(3/monToExp)
+def calc_volshock(dte):
+    """MAC vol shock (as a fraction of implied vol) for days to expiration."""
+    monToExp = 12 * np.asarray(dte, dtype = float)/365
+    shock    = 0.35 * np.sqrt(3/monToExp)
     return shock
 
     
-def __volliquiditycharge(pos):
-    moneyness = abs((pos['Forward'] - pos['Strike'])/pos['Forward'])
-    if moneyness < 0.3:
-        liqvolcharge = 0.1
-    elif moneyness < 0.45:
-        liqvolcharge = 0.2
-    else:
-        liqvolcharge = 0.3
-    return liqvolcharge
+__LIQ_MONEYNESS = [0.3, 0.45]
+__LIQ_CHARGE    = np.array([0.1, 0.2, 0.3])
+
+def calc_volliquiditycharge(forward, strike):
+    """Vega liquidity charge by moneyness bucket: below 30% -> 0.1,
+    below 45% -> 0.2, otherwise (nan included) 0.3."""
+    moneyness = np.abs((forward - strike)/forward)
+    bucket    = np.searchsorted(__LIQ_MONEYNESS, moneyness, side = 'right')
+    return __LIQ_CHARGE[bucket]
 
     
-def getPortfolio(path_to_csv):
-    """.csv to numpy structured array containing a portfolio."""
+def getPortfolio(path_to_csv, writer = None, recorder = None):
+    """.csv (or columnar store, see positions.STORE_SUFFIX) to numpy 
+    structured array containing a portfolio. A store's mapped columns are
+    copied once into the array; the expiry roll only copies it again when
+    options have expired."""
+    if recorder is None:
+        recorder = instrument.NULL_RECORDER
     if not os.path.isfile(path_to_csv):
         raise Exception('File does not exist.')
+    elif path_to_csv.endswith(positions.STORE_SUFFIX):
+        with recorder.stage('load'):
+            portfolio, timestamp = positions.read_store(path_to_csv)
     else:
-        portfolio  = np.genfromtxt(path_to_csv, dtype = float, 
-                                   delimiter = ',', names = True)
-        clean      = check_for_expiring(portfolio)
-        fieldnames = portfolio.dtype.names
-        timestamp  = path_to_csv[-18:-4]
+        with recorder.stage('load'):
+            portfolio = positions.read_positions(path_to_csv)
+        timestamp = positions.extract_timestamp(path_to_csv)
+    
+    with recorder.stage('expiryRoll'):
+        clean  = check_for_expiring(portfolio)
+    if writer is not None:
+        with recorder.stage('output'):
+            writer.write('nonExpiredPosition', clean)
+    fieldnames = portfolio.dtype.names
     return clean, fieldnames, timestamp
 
 
-def check_for_expiring(portfolio, daysForward = 0):
+def check_for_expiring(portfolio, daysForward = 0, writer = None):
     """Converts the net delta of any options with a expired (negative DTE) to
-    SPY. Expired options are removed from the position."""
+    SPY. Expired options are removed from the position. If every line is
+    live the portfolio itself is returned, not a copy."""
     if abs(daysForward) > 0:
         portfolio['DTE'][:] = portfolio['DTE'][:] - abs(daysForward)
     
+    if (portfolio['DTE'] > 0).all():
+        if writer is not None:
+            writer.write('nonExpiredPosition', portfolio)
+        return portfolio
+    
     expired      = portfolio[:][portfolio['DTE'] <= 0]
     expiredDelta = 10 * (expired['Delta'] * expired['Quantity']).sum(axis = 0)
     
@@ -163,8 +538,81 @@ def check_for_expiring(portfolio, daysForward = 0):
 
     notExpired['Quantity'][stockIdx] = (notExpired['Quantity'][stockIdx]
                                         + expiredDelta)
-    np.savetxt('nonExpiredPosition.csv' , notExpired, delimiter = ',')
+    if writer is not None:
+        writer.write('nonExpiredPosition', notExpired)
     return notExpired
+
+
+def calc_margin_curve(portfolio, daysForward = range(31), 
+                      maxCells = 4000000):
+    """Accept a portfolio and a sequence of horizons in days. Return a 
+    MarginCurve with one margin per horizon, as check_for_expiring(portfolio,
+    days) followed by calc_margin_result would give, in one pass over the
+    book. The portfolio is neither copied nor changed."""
+    priceShocks, nShocks = define_priceshocks()
+    shocks = 1 + np.asarray(priceShocks, dtype = float)
+    days   = np.abs(np.asarray(daysForward, dtype = float))
+    
+    cp       = portfolio['CP']
+    isStock  = (cp == 3) | (cp == 4)
+    isOption = (cp == 1) | (cp == 2)
+    if not np.all(isStock | isOption):
+        raise Exception('Position type not recognized.')
+    
+    # rows = positions, cols = horizons
+    dte  = portfolio['DTE'][:, np.newaxis] - days
+    live = dte > 0
+    with np.errstate(invalid = 'ignore'):
+        rolled = np.where(dte <= 0, 
+                          (portfolio['Delta'] * portfolio['Quantity'])
+                          [:, np.newaxis], 0)
+    expiredDelta = 10 * rolled.sum(axis = 0)
+    
+    # Price risk: shocks x horizons, netted options in blocks of contracts
+    totals    = np.zeros((nShocks, days.shape[0]))
+    optIdx    = np.flatnonzero(isOption)
+    contracts = net_contracts(portfolio[optIdx])[0]
+    blockSize = max(1, maxCells // totals.size)
+    for start in range(0, contracts.shape[0], blockSize):
+        block = contracts[start:start + blockSize]
+        col   = lambda name: block[name][:, np.newaxis, np.newaxis]
+        theo  = col('Theo_Price')
+        cDte  = block['DTE'][:, np.newaxis] - days
+        newPrice = bs.calc_price_array(theo * shocks[:, np.newaxis], 
+                   col('Strike'), col('Implied_Vol'), cDte[:, np.newaxis, :],
+                   col('CP'))
+        pnl = col('Multiplier') * col('Quantity') * (newPrice - theo)
+        totals += np.where((cDte > 0)[:, np.newaxis, :], pnl, 0).sum(axis = 0)
+    
+    # Stock lines, with the expired delta rolled into CP 3 at each horizon
+    stockIdx = np.flatnonzero(isStock)
+    quantity = (portfolio['Quantity'][stockIdx, np.newaxis] 
+                + np.where(cp[stockIdx, np.newaxis] == 3, expiredDelta, 0))
+    theo     = portfolio['Theo_Price'][stockIdx, np.newaxis]
+    moves    = theo * shocks - theo
+    pnl      = ((portfolio['Multiplier'][stockIdx, np.newaxis] * quantity)
+                [:, np.newaxis, :] * moves[:, :, np.newaxis])
+    totals  += np.where(live[stockIdx, np.newaxis, :], pnl, 0).sum(axis = 0)
+    
+    # Vol and vega liquidity risk: options x horizons
+    opt = portfolio[optIdx]
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        shock = calc_volshock(dte[optIdx])
+    liqCharge = calc_volliquiditycharge(opt['Forward'], opt['Strike'])
+    liqShift  = np.minimum(2, np.abs(shock * opt['Implied_Vol'][:, np.newaxis]
+                                     * liqCharge[:, np.newaxis] * 100))
+    qv        = (opt['Quantity'] * opt['Vega'])[:, np.newaxis]
+    volRisk   = np.where(live[optIdx], np.abs(qv * shock 
+                         * opt['Implied_Vol'][:, np.newaxis] * 100), 0)
+    vegaLiq   = np.where(live[optIdx], qv * liqShift, 0)
+    
+    priceRisk   = totals.min(axis = 0)
+    worstBucket = np.asarray(priceShocks)[totals.argmin(axis = 0)]
+    volRisk     = volRisk.sum(axis = 0)
+    vegaLiqRisk = np.maximum(np.abs(vegaLiq.sum(axis = 0)), 
+                             0.2 * np.abs(vegaLiq).sum(axis = 0))
+    return MarginCurve(days, priceRisk, worstBucket, volRisk, vegaLiqRisk,
+                       priceRisk + volRisk + vegaLiqRisk)
     
     
 def timing(f):
@@ -174,27 +622,61 @@ def timing(f):
         time2 = time.time()
         print 'The %s function took %0.3f ms.' % (f.func_name, 
               (time2-time1)*1000.0)
+        return val
     return wrap
 
 
-@timing
-def calc_margin(inFileName):
-    portfolio, fieldNames, timestamp = getPortfolio(inFileName)
-    
-    priceRisk, worstBucket = calc_pricerisk(portfolio, timestamp)
-    volRisk, vegaLiqRisk   = calc_volrisk(portfolio, timestamp)
+def calc_margin_summary(inFileName, writer = None, cache = None, 
+                        recorder = None, chunkSize = None, threads = None):
+    """Margin one position file. Return a dict of its risk components.
+    A recorder gets the run's stage timings and emits them at the end.
+    With chunkSize, the book is margined by calc_margin_chunked."""
+    if recorder is None:
+        recorder = instrument.NULL_RECORDER
+    portfolio, fieldNames, timestamp = getPortfolio(inFileName, writer, 
+                                                    recorder)
+    if chunkSize is None:
+        result = calc_margin_result(portfolio, timestamp, writer, cache, 
+                                    recorder)
+    elif cache is not None:
+        raise Exception('Chunked runs do not use a shock cache.')
+    else:
+        result = calc_margin_chunked(portfolio, timestamp, writer, 
+                                     chunkSize = chunkSize, 
+                                     threads = threads, recorder = recorder)
+    recorder.emit(file = inFileName, macMargin = result.macMargin)
     
-    macMargin = priceRisk + volRisk[0] + vegaLiqRisk[0]
+    return {'File'          : inFileName,
+            'Timestamp'     : result.timestamp,
+            'Price_Risk'    : result.priceRisk,
+            'Worst_Bucket'  : result.worstBucket,
+            'Vol_Risk'      : result.volRisk,
+            'Vega_Liq_Risk' : result.vegaLiqRisk,
+            'MAC_Margin'    : result.macMargin}
+
+
+@timing
+def calc_margin(inFileName, writer = None):
+    summary = calc_margin_summary(inFileName, writer)
     
-    print 'Portfolio Price Risk is %r from bucket %d.' % (priceRisk, worstBucket)
-    print 'Portfolio Volatility Risk is %d.' % volRisk[0]
-    print 'Portfolio Vega Liquidity Risk is %d.' % vegaLiqRisk[0]
-    print 'Portfolio MAC Margin is %d.' % macMargin
-    return macMargin
+    print 'Portfolio Price Risk is %r from bucket %d.' % (
+          summary['Price_Risk'], summary['Worst_Bucket'])
+    print 'Portfolio Volatility Risk is %d.' % summary['Vol_Risk']
+    print 'Portfolio Vega Liquidity Risk is %d.' % summary['Vega_Liq_Risk']
+    print 'Portfolio MAC Margin is %d.' % summary['MAC_Margin']
+    return summary['MAC_Margin']
 
 
 ## Main
-script, fileName = sys.argv
-print 'Calculating margin for the position at %r.' % fileName[-17:-4]
-macMargin = calc_margin(fileName)
-print 'Done.'
\ No newline at end of file
+if __name__ == '__main__':
+    script, fileName = sys.argv[:2]
+    print 'Calculating margin for the position at %r.' % fileName[-17:-4]
+    macMargin = calc_margin(fileName, CsvWriter('.'))
+    
+    # Optional: margin over the next N days
+    if len(sys.argv) > 2:
+        portfolio, fieldNames, timestamp = getPortfolio(fileName)
+        curve = calc_margin_curve(portfolio, range(int(sys.argv[2]) + 1))
+        for days, margin in zip(curve.daysForward, curve.macMargin):
+            print 'Day %3d: MAC Margin is %d.' % (days, margin)
+    print 'Done.'
\ No newline at end of file
@@ -0,0 +1,309 @@
+"""
+Golden-file regression harness for the margin engines.
+* Replays a book through every engine available here and compares the
+  priceRisk matrix and the volRisk/vegaLiqRisk vectors with a reference:
+  - python:    the original row-by-row loop over the original scalar Black
+               price, written out here apart from the shared pricing core
+  - numpy:     the vectorized matrix with the NumPy pricing functions
+  - kernel:    the same with the typed Cython kernel, if it is built
+  - cache:     the vectorized matrix through a warm shockcache.ShockCache
+  - scenarios: the price-shock slice of scenarios.calc_scenarios
+  - chunked:   calc_margin_chunked in small blocks on two threads
+  and the MAC margin of marginbook.MarginBook, marginstream.MarginStream
+  and calc_margin_curve
+* The price grid (macmargin.make_price_grid) is approximate; each of its
+  price moves must be within the grid's error bound, and the share of
+  prices read from the grid is reported
+* The exported book is checked against the priceRisk_/volRisk_/vegaLiqRisk_
+  .csv files committed next to it; generated books against the python loop,
+  each once as generated and once with repeated lines of some contracts
+  that offset or add to the first
+* Errors are reported per shock bucket, relative to the largest reference
+  value in the bucket; the run fails beyond RTOL
+* ex50/tests/test_regress.py runs the checks on the exported book and a
+  small generated one under unittest
+* Usage: python macregress.py [position .csv ...] [--generated N ...]
+"""
+
+
+from __future__ import division
+import sys
+import os
+import json
+import tempfile
+from math import log, sqrt, erfc
+import numpy as np
+import macmargin as mm
+import _optionpricing_dte as bs
+import _optionpricing_core
+import marginbook
+import marginstream
+import scenarios
+import shockcache
+import macbench
+
+RTOL = 1e-9
+
+GOLDEN_BOOK = 'position_s12_20161202_1529.csv'
+
+
+def reference_price(forward, strike, iv, dte, oType):
+    """The original _optionpricing_dte.calc_price, with the normal cdf from
+    math.erfc in place of scipy."""
+    if iv <= 0 or dte <= 0:
+        if oType == 1:
+            return max(forward - strike, 0)
+        return max(strike - forward, 0)
+    d1 = (log(forward/strike) / (iv * sqrt(dte/365))
+          + iv/2 * sqrt(dte/365))
+    d2 = (log(forward/strike) / (iv * sqrt(dte/365))
+          - iv/2 * sqrt(dte/365))
+    x1 = erfc(-d1 / sqrt(2)) / 2
+    x2 = erfc(-d2 / sqrt(2)) / 2
+    if oType == 1:
+        return forward * x1 - strike * x2
+    return strike * (1 - x2) - forward * (1 - x1)
+
+
+def python_engine(portfolio):
+    """The original per-position, per-shock loop."""
+    priceShocks, nShocks = mm.define_priceshocks()
+    nPos      = portfolio.shape[0]
+    priceRisk = np.zeros((nPos, nShocks))
+    for row in range(nPos):
+        pos = portfolio[row]
+        for col in range(nShocks):
+            newPrice = pos['Theo_Price'] * (1 + priceShocks[col])
+            if pos['CP'] == 1 or pos['CP'] == 2:
+                newPrice = reference_price(newPrice, pos['Strike'],
+                           pos['Implied_Vol'], pos['DTE'], pos['CP'])
+            priceRisk[row, col] = (pos['Multiplier'] * pos['Quantity']
+                                   * (newPrice - pos['Theo_Price']))
+
+    volRisk     = np.zeros((nPos, 1))
+    vegaLiqRisk = np.zeros((nPos, 1))
+    for row in range(nPos):
+        pos = portfolio[row]
+        if pos['CP'] == 1 or pos['CP'] == 2:
+            shock     = 0.35 * np.sqrt(3/(12 * pos['DTE']/365))
+            moneyness = abs((pos['Forward'] - pos['Strike'])/pos['Forward'])
+            if moneyness < 0.3:
+                liqCharge = 0.1
+            elif moneyness < 0.45:
+                liqCharge = 0.2
+            else:
+                liqCharge = 0.3
+            liqShift = min(2, abs(shock * pos['Implied_Vol'] * liqCharge
+                                  * 100))
+            volRisk[row]     = abs(pos['Quantity'] * pos['Vega'] * shock
+                                   * pos['Implied_Vol'] * 100)
+            vegaLiqRisk[row] = pos['Quantity'] * pos['Vega'] * liqShift
+    return priceRisk, volRisk, vegaLiqRisk
+
+
+def vectorized_engine(useKernel):
+    def engine(portfolio):
+        saved = _optionpricing_core.USE_KERNEL
+        _optionpricing_core.USE_KERNEL = useKernel
+        try:
+            result = mm.calc_margin_result(portfolio)
+        finally:
+            _optionpricing_core.USE_KERNEL = saved
+        return (result.priceRiskMatrix, result.volRiskVector,
+                result.vegaLiqRiskVector)
+    return engine
+
+
+def cache_engine(portfolio):
+    cache = shockcache.ShockCache()
+    mm.calc_margin_result(portfolio, cache = cache)
+    result = mm.calc_margin_result(portfolio, cache = cache)
+    return (result.priceRiskMatrix, result.volRiskVector,
+            result.vegaLiqRiskVector)
+
+
+def scenarios_engine(portfolio):
+    result = scenarios.calc_scenarios(portfolio, keepCube = True)
+    volRisk, vegaLiqRisk = mm.calc_volrisk_vectors(portfolio)
+    return result.pnl[:, :, 0, 0], volRisk, vegaLiqRisk
+
+
+def chunked_engine(portfolio):
+    result = mm.calc_margin_chunked(portfolio, chunkSize = 50, threads = 2,
+                                    keepRows = True)
+    return (result.priceRiskMatrix, result.volRiskVector,
+            result.vegaLiqRiskVector)
+
+
+def stream_margin(portfolio, burst = 500):
+    """MAC margin of the book replayed as fill messages through a
+    MarginStream, in bursts of burst messages, and the number of messages
+    not accounted for in the published records (0 if all are)."""
+    stream    = marginstream.MarginStream(output = None)
+    messages  = [json.dumps(message) for message
+                 in marginstream.position_messages(portfolio)]
+    published = 0
+    for start in range(0, len(messages), burst):
+        published += stream.apply(messages[start:start + burst])['Messages']
+    return stream.book.macMargin, len(messages) - published
+
+
+def with_repeated_lines(portfolio, seed = 0):
+    """The book plus a second line for a fifth of its options, as from
+    another sub-account, in shuffled order: half offset the first line
+    exactly, the rest add a random quantity of either sign."""
+    rng     = np.random.RandomState(seed)
+    options = np.flatnonzero((portfolio['CP'] == 1) | (portfolio['CP'] == 2))
+    rows    = rng.choice(options, options.shape[0] // 5, replace = False)
+    lines   = portfolio[rows]
+    lines['Quantity'] = np.where(rng.rand(rows.shape[0]) < 0.5,
+                                 -lines['Quantity'],
+                                 rng.randint(-500, 501, rows.shape[0]))
+    book = np.concatenate([portfolio, lines])
+    return book[rng.permutation(book.shape[0])]
+
+
+def available_engines():
+    engines = [('python', python_engine),
+               ('numpy',  vectorized_engine(False))]
+    if _optionpricing_core._kernel is not None:
+        engines.append(('kernel', vectorized_engine(True)))
+    engines += [('cache',     cache_engine),
+                ('scenarios', scenarios_engine),
+                ('chunked',   chunked_engine)]
+    return engines
+
+
+def calc_errors(ours, reference):
+    """Max abs error and max error relative to the largest reference value
+    of each column."""
+    ours, reference = np.atleast_2d(ours.T).T, np.atleast_2d(reference.T).T
+    absErr = np.abs(ours - reference).max(axis = 0)
+    scale  = np.abs(reference).max(axis = 0)
+    relErr = np.where(scale > 0, absErr / np.where(scale > 0, scale, 1),
+                      absErr)
+    return absErr, relErr
+
+
+def check_book(portfolio, reference, label):
+    """Compare every engine with reference = (priceRisk, volRisk,
+    vegaLiqRisk). Print the report and return the number of failures."""
+    priceShocks, nShocks = mm.define_priceshocks()
+    engines  = available_engines()
+    failures = 0
+    refMargin = mm.calc_margin_result(portfolio).macMargin
+
+    print '\n%s: %d positions' % (label, portfolio.shape[0])
+    rows = []
+    for name, engine in engines:
+        priceRisk, volRisk, vegaLiqRisk = engine(portfolio)
+        priceAbs, priceRel = calc_errors(priceRisk, reference[0])
+        volAbs,   volRel   = calc_errors(volRisk, reference[1])
+        liqAbs,   liqRel   = calc_errors(vegaLiqRisk, reference[2])
+        rows.append((name, priceAbs, priceRel, volRel[0], liqRel[0]))
+        worst = max(priceRel.max(), volRel[0], liqRel[0])
+        if not worst <= RTOL:
+            failures += 1
+            print 'FAIL %s: max rel err %.3e' % (name, worst)
+
+    print '%8s' % 'shock' + ''.join('%12s' % r[0] for r in rows)
+    for col in range(nShocks):
+        print '%8.3f' % priceShocks[col] + ''.join('%12.2e' % r[2][col]
+                                                    for r in rows)
+    print '%8s' % 'max abs' + ''.join('%12.2e' % r[1].max() for r in rows)
+    print '%8s' % 'volRisk' + ''.join('%12.2e' % r[3] for r in rows)
+    print '%8s' % 'vegaLiq' + ''.join('%12.2e' % r[4] for r in rows)
+
+    streamMargin, unpublished = stream_margin(portfolio)
+    if unpublished:
+        failures += 1
+        print 'FAIL MarginStream: %d messages not published' % unpublished
+    for name, macMargin in [('MarginBook',
+                             marginbook.MarginBook(portfolio).macMargin),
+                            ('MarginStream', streamMargin),
+                            ('calc_margin_curve',
+                             mm.calc_margin_curve(portfolio, [0])
+                             .macMargin[0])]:
+        relErr = abs(macMargin - refMargin) / abs(refMargin)
+        print '%-18s MAC margin rel err %.2e' % (name, relErr)
+        if not relErr <= RTOL:
+            failures += 1
+            print 'FAIL %s' % name
+    return failures + check_grid(portfolio, reference[0])
+
+
+def check_grid(portfolio, priceRisk):
+    """Compare the price grid engine with the reference priceRisk matrix,
+    allowing each price its error bound. Print the report and return the
+    number of failures."""
+    priceShocks, nShocks = mm.define_priceshocks()
+    options = portfolio[(portfolio['CP'] == 1) | (portfolio['CP'] == 2)]
+    grid    = mm.make_price_grid(portfolio)
+    hitRate = grid.hit_rate(options['Theo_Price'], priceShocks,
+              options['Strike'], options['Implied_Vol'],
+              options['DTE'] / bs.DAYS_PER_YEAR)
+    result  = mm.calc_margin_result(portfolio, priceGrid = grid)
+
+    # The grid's error bound, at the shocked forward, in position terms
+    bound = (np.abs(portfolio['Multiplier'] * portfolio['Quantity']
+                    * portfolio['Theo_Price'])[:, np.newaxis]
+             * (1 + np.asarray(priceShocks)) * grid.maxError)
+    excess = (np.abs(result.priceRiskMatrix - priceRisk)
+              / np.maximum(bound, RTOL * np.abs(priceRisk).max()))
+    print '%-18s hit rate %.1f%%, max err %.2f of bound' % ('price grid',
+          100 * hitRate, excess.max())
+    if not excess.max() <= 1:
+        print 'FAIL price grid'
+        return 1
+    return 0
+
+
+def generated_book(nPos, seed = 0):
+    """A book of nPos positions from macbench.make_book, after the expiry
+    roll."""
+    path = tempfile.mktemp(prefix = 'position_regress_', suffix = '.csv')
+    macbench.make_book(nPos, path, seed)
+    try:
+        portfolio, fieldNames, timestamp = mm.getPortfolio(path)
+    finally:
+        os.remove(path)
+    return portfolio
+
+
+def load_golden(path_to_csv):
+    """The book and its committed priceRisk/volRisk/vegaLiqRisk .csv files.
+    """
+    portfolio, fieldNames, timestamp = mm.getPortfolio(path_to_csv)
+    directory = os.path.dirname(path_to_csv)
+    reference = [np.loadtxt(os.path.join(directory, name + timestamp
+                                         + '.csv'), delimiter = ',', ndmin = 2)
+                 for name in ['priceRisk', 'volRisk', 'vegaLiqRisk']]
+    reference[1] = reference[1].reshape(-1, 1)
+    reference[2] = reference[2].reshape(-1, 1)
+    return portfolio, reference
+
+
+## Main
+if __name__ == '__main__':
+    args      = sys.argv[1:]
+    books     = [a for a in args if a.endswith('.csv')] or [GOLDEN_BOOK]
+    generated = [int(a) for a in args if a.isdigit()]
+    if '--generated' in args and not generated:
+        generated = [1000, 5000]
+
+    failures = 0
+    for path in books:
+        portfolio, reference = load_golden(path)
+        failures += check_book(portfolio, reference, path)
+
+    for nPos in generated:
+        portfolio = generated_book(nPos)
+        failures += check_book(portfolio, python_engine(portfolio),
+                               'generated book')
+        portfolio = with_repeated_lines(portfolio)
+        failures += check_book(portfolio, python_engine(portfolio),
+                               'generated book with repeated lines')
+
+    print '\n%s' % ('%d checks failed.' % failures if failures
+                    else 'All engines agree.')
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,463 @@
+"""
+Keeps the MAC margin of a portfolio up to date as positions change.
+* A contract's shocked price moves and vol shifts are calculated once, when
+  it enters the book; a quantity change only rescales its rows
+* totalPriceRisk, vol risk and the net/gross vega liquidity sums are updated
+  by difference, so a change costs O(changed rows) instead of O(book)
+* Contracts are keyed by (DTE, Strike, CP), see position_key; blank DTE and
+  Strike (the stock line) become None
+* Repeated lines of a contract (e.g. sub-accounts) share its slot, but, as
+  in macmargin, their vol risk and gross vega liquidity count line by line:
+  the slot keeps the net and gross quantity of the lines after the first.
+  change_quantity and set_quantity act on the first line; add_lines and
+  add_position of a held contract add lines
+* Running sums pick up rounding over many updates; refresh() re-adds them
+* what_if_trades prices a batch of candidate trades against the book in one
+  vectorized pass, repricing only contracts the book does not hold; each
+  leg counts as a new line
+* mark changes the marks (Theo_Price, Implied_Vol, Forward, ...) of some
+  contracts and reprices those alone
+* Run this module on an export to time updates against a full recalculation
+"""
+
+
+from __future__ import division
+import sys
+import time
+import numpy as np
+import macmargin as mm
+
+
+def position_key(pos):
+    """(DTE, Strike, CP) of a position record; nan fields become None."""
+    dte, strike = float(pos['DTE']), float(pos['Strike'])
+    return (None if np.isnan(dte) else dte,
+            None if np.isnan(strike) else strike,
+            int(pos['CP']))
+
+
+def default_priceshocks():
+    """The MAC price shocks used by macmargin."""
+    priceShocks, nShocks = mm.define_priceshocks()
+    return priceShocks
+
+
+class MarginBook(object):
+    """MAC margin of a portfolio that can be changed position by position.
+    The portfolio is copied; the caller's array is never modified."""
+    def __init__(self, portfolio, priceShocks = None):
+        if priceShocks is None:
+            priceShocks = default_priceshocks()
+        self.priceShocks = np.asarray(priceShocks, dtype = float)
+        self.dtype       = portfolio.dtype
+
+        self._slots    = {}
+        self._free     = []
+        self._capacity = 0
+        self.__grow(max(16, 2 * portfolio.shape[0]))
+
+        keys, firstRows = [position_key(pos) for pos in portfolio], []
+        for row, key in enumerate(keys):
+            if key not in self._slots:
+                self._slots[key] = len(firstRows)
+                firstRows.append(row)
+            else:
+                self.__check_duplicate(portfolio[row],
+                                       portfolio[firstRows[self._slots[key]]])
+        nSlots = len(firstRows)
+        self.__store(np.arange(nSlots), portfolio[firstRows])
+        for row, (key, quantity) in enumerate(zip(keys,
+                                                  portfolio['Quantity'])):
+            slot = self._slots[key]
+            self._quantity[slot] += quantity
+            if row != firstRows[slot]:
+                self._extraNet[slot]   += quantity
+                self._extraGross[slot] += abs(quantity)
+        self._free = range(self._capacity - 1, nSlots - 1, -1)
+        self.refresh()
+
+    def __check_duplicate(self, pos, first):
+        # Lines of one contract share a slot, which is only right if
+        # everything but their quantities is the same
+        for name in self.dtype.names:
+            if name != 'Quantity' and not (pos[name] == first[name] or
+                    (np.isnan(pos[name]) and np.isnan(first[name]))):
+                raise Exception('Position %r appears twice with different '
+                                '%s.' % (position_key(pos), name))
+
+    def __grow(self, capacity):
+        old = self._capacity
+        nShocks = self.priceShocks.shape[0]
+
+        def grow(name, shape, dtype = float):
+            new = np.zeros(shape, dtype = dtype)
+            if old:
+                new[:old] = getattr(self, name)
+            setattr(self, name, new)
+
+        grow('_moves',      (capacity, nShocks))
+        grow('_rows',       (capacity, nShocks))
+        grow('_quantity',   capacity)
+        grow('_volRisk',    capacity)
+        grow('_vegaLiq',    capacity)
+        grow('_liqGross',   capacity)
+        # Net and gross quantity of the lines after the first
+        grow('_extraNet',   capacity)
+        grow('_extraGross', capacity)
+        # Multiplier, Vega, Implied_Vol, vol shock, liquidity shift
+        grow('_contracts',  (capacity, 5))
+        # The contract's record, for repricing it on new marks
+        grow('_records',    capacity, self.dtype)
+        self._free     = range(capacity - 1, old - 1, -1) + self._free
+        self._capacity = capacity
+
+    def __contract_data(self, portfolio):
+        # Contract data that does not depend on quantity: the price moves
+        # and the Multiplier, Vega, Implied_Vol, vol shock, liquidity shift
+        isOption, shock, liqShift = mm.calc_volshifts(portfolio)
+        contracts = np.column_stack([portfolio['Multiplier'],
+                    np.where(isOption, portfolio['Vega'], 0),
+                    np.where(isOption, portfolio['Implied_Vol'], 0),
+                    shock, liqShift])
+        return mm.calc_price_moves(portfolio, self.priceShocks), contracts
+
+    def __store(self, slots, portfolio):
+        self._moves[slots], self._contracts[slots] = self.__contract_data(
+                                                       portfolio)
+        self._records[slots] = portfolio
+
+    def __rescale(self, slots):
+        # Same operations, in the same order, as macmargin's full calculation
+        # for the first line; the other lines add their gross quantity
+        quantity = self._quantity[slots]
+        first    = quantity - self._extraNet[slots]
+        extra    = self._extraGross[slots]
+        mult, vega, iv, shock, liqShift = self._contracts[slots].T
+        self._rows[slots]     = ((mult * quantity)[:, np.newaxis]
+                                 * self._moves[slots])
+        self._volRisk[slots]  = (np.abs(first * vega * shock * iv * 100)
+                                 + extra * np.abs(vega * shock * iv * 100))
+        self._vegaLiq[slots]  = quantity * vega * liqShift
+        self._liqGross[slots] = (np.abs(first * vega * liqShift)
+                                 + extra * np.abs(vega * liqShift))
+
+    def __update(self, slot):
+        # Take the slot's old contribution out of the totals, put the new in
+        self.totalPriceRisk -= self._rows[slot]
+        self._volTotal      -= self._volRisk[slot]
+        self._netLiq        -= self._vegaLiq[slot]
+        self._grossLiq      -= self._liqGross[slot]
+        self.__rescale(slice(slot, slot + 1))
+        self.totalPriceRisk += self._rows[slot]
+        self._volTotal      += self._volRisk[slot]
+        self._netLiq        += self._vegaLiq[slot]
+        self._grossLiq      += self._liqGross[slot]
+
+    def __update_many(self, slots, reprice = False):
+        # __update for an array of distinct slots; with reprice, the
+        # contract data is first recalculated from their records
+        self.totalPriceRisk -= self._rows[slots].sum(axis = 0)
+        self._volTotal      -= self._volRisk[slots].sum()
+        self._netLiq        -= self._vegaLiq[slots].sum()
+        self._grossLiq      -= self._liqGross[slots].sum()
+        if reprice:
+            self.__store(slots, self._records[slots])
+        self.__rescale(slots)
+        self.totalPriceRisk += self._rows[slots].sum(axis = 0)
+        self._volTotal      += self._volRisk[slots].sum()
+        self._netLiq        += self._vegaLiq[slots].sum()
+        self._grossLiq      += self._liqGross[slots].sum()
+
+    def refresh(self):
+        """Recalculate the totals from the per-position rows."""
+        slots = np.array(sorted(self._slots.values()), dtype = np.intp)
+        self.__rescale(slots)
+        self.totalPriceRisk = self._rows[slots].sum(axis = 0)
+        self._volTotal      = self._volRisk[slots].sum()
+        self._netLiq        = self._vegaLiq[slots].sum()
+        self._grossLiq      = self._liqGross[slots].sum()
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, key):
+        return key in self._slots
+
+    def quantity(self, key):
+        return self._quantity[self._slots[key]]
+
+    def keys(self):
+        return self._slots.keys()
+
+    def record(self, key):
+        """The contract's record, with its current quantity."""
+        slot   = self._slots[key]
+        record = self._records[slot].copy()
+        record['Quantity'] = self._quantity[slot]
+        return record
+
+    def add_position(self, pos):
+        """Add a position record (any mapping with the portfolio's fields).
+        If the contract is already in the book the record is added as
+        another line of it; the book keeps its other fields."""
+        key = position_key(pos)
+        if key in self._slots:
+            self.add_lines([(key, pos['Quantity'])])
+            return
+
+        if not self._free:
+            self.__grow(2 * self._capacity)
+        slot = self._free.pop()
+
+        record = np.zeros(1, dtype = self.dtype)
+        for name in self.dtype.names:
+            record[name] = pos[name]
+        self.__store(np.array([slot]), record)
+        self.__clear(slot, pos['Quantity'])
+        self._slots[key] = slot
+        self.__update(slot)
+
+    def __clear(self, slot, quantity):
+        # A new contract's slot: one line of quantity, nothing in the totals
+        self._quantity[slot]   = quantity
+        self._extraNet[slot]   = 0
+        self._extraGross[slot] = 0
+        self._rows[slot]       = 0
+        self._volRisk[slot]    = 0
+        self._vegaLiq[slot]    = 0
+        self._liqGross[slot]   = 0
+
+    def add_positions(self, portfolio):
+        """add_position for every record of a portfolio with the book's
+        dtype, pricing all the new contracts in one call."""
+        slots, lines = [], []
+        for pos in portfolio:
+            key = position_key(pos)
+            if key in self._slots:
+                lines.append((key, pos['Quantity']))
+                continue
+            if not self._free:
+                self.__grow(2 * self._capacity)
+            slot = self._free.pop()
+            self._records[slot] = pos
+            self.__clear(slot, pos['Quantity'])
+            self._slots[key] = slot
+            slots.append(slot)
+        if slots:
+            self.__update_many(np.array(slots, dtype = np.intp), True)
+        self.add_lines(lines)
+
+    def add_lines(self, lines):
+        """Add (key, quantity) pairs to contracts the book holds, each as a
+        line of its own, updating the totals once."""
+        if not lines:
+            return
+        slots    = np.array([self._slots[key] for key, q in lines],
+                            dtype = np.intp)
+        quantity = np.array([q for key, q in lines], dtype = float)
+        np.add.at(self._quantity,   slots, quantity)
+        np.add.at(self._extraNet,   slots, quantity)
+        np.add.at(self._extraGross, slots, np.abs(quantity))
+        self.__update_many(np.unique(slots))
+
+    def remove_position(self, key):
+        """Take a contract out of the book."""
+        self.set_quantity(key, 0)
+        slot = self._slots.pop(key)
+        self._free.append(slot)
+
+    def mark(self, marks):
+        """Apply (key, {field: value}) pairs of new marks, e.g. 
+        {'Theo_Price': 2.5, 'Implied_Vol': 0.18}, and reprice the contracts
+        they touch. The key fields and Quantity cannot be marked."""
+        slots = set()
+        for key, fields in marks:
+            slot = self._slots[key]
+            for name, value in fields.items():
+                if name in ('DTE', 'Strike', 'CP', 'Quantity'):
+                    raise Exception('%s cannot be marked.' % name)
+                self._records[name][slot] = value
+            slots.add(slot)
+        if slots:
+            self.__update_many(np.array(sorted(slots), dtype = np.intp), True)
+
+    def set_quantity(self, key, quantity):
+        """Make the contract a single line of quantity."""
+        slot = self._slots[key]
+        self._quantity[slot]   = quantity
+        self._extraNet[slot]   = 0
+        self._extraGross[slot] = 0
+        self.__update(slot)
+
+    def change_quantity(self, key, deltaQuantity):
+        """Change the quantity of the contract's first line."""
+        slot = self._slots[key]
+        self._quantity[slot] += deltaQuantity
+        self.__update(slot)
+
+    def set_quantities(self, quantities):
+        """set_quantity for (key, quantity) pairs, updating the totals once;
+        the last quantity given for a key wins."""
+        slots = dict((self._slots[key], quantity) 
+                     for key, quantity in quantities)
+        if slots:
+            idx = np.array(slots.keys(), dtype = np.intp)
+            self._quantity[idx]   = slots.values()
+            self._extraNet[idx]   = 0
+            self._extraGross[idx] = 0
+            self.__update_many(idx)
+
+    def apply(self, changes):
+        """Apply (key, deltaQuantity) pairs; unknown keys must be added with
+        add_position first."""
+        for key, deltaQuantity in changes:
+            self.change_quantity(key, deltaQuantity)
+
+    @property
+    def priceRisk(self):
+        return self.totalPriceRisk.min()
+
+    @property
+    def worstBucket(self):
+        return self.priceShocks[np.argmin(self.totalPriceRisk)]
+
+    @property
+    def volRisk(self):
+        return self._volTotal
+
+    @property
+    def vegaLiqRisk(self):
+        return max(abs(self._netLiq), 0.2 * self._grossLiq)
+
+    @property
+    def macMargin(self):
+        return self.priceRisk + self.volRisk + self.vegaLiqRisk
+
+    def what_if(self, key, deltaQuantity):
+        """MAC margin if a line of deltaQuantity were added to an existing
+        contract. The book is left unchanged."""
+        leg = self.record(key)
+        leg['Quantity'] = deltaQuantity
+        return self.what_if_trades([[leg]])[0]
+
+    def what_if_trades(self, trades):
+        """MAC margin the book would have after each of a list of candidate
+        trades, as an array. A trade is a list of legs, position records as
+        for add_position; each leg counts as a line of its own, so a margin
+        is what calc_margin_result gives for the book's lines plus the
+        trade's legs. The book is left unchanged."""
+        legs = [(n, leg) for n, trade in enumerate(trades) for leg in trade]
+        if not legs:
+            return np.zeros(len(trades)) + self.macMargin
+        record = np.zeros(len(legs), dtype = self.dtype)
+        for i, (n, leg) in enumerate(legs):
+            for name in self.dtype.names:
+                record[name][i] = leg[name]
+
+        # Contract of each leg: a slot of the book, or its index among the
+        # contracts the book does not hold, priced here once each
+        newKeys, newRows, held, legContract = {}, [], [], []
+        for row, pos in enumerate(record):
+            key = position_key(pos)
+            held.append(key in self._slots)
+            if held[-1]:
+                legContract.append(self._slots[key])
+            else:
+                if key not in newKeys:
+                    newKeys[key] = len(newRows)
+                    newRows.append(row)
+                legContract.append(newKeys[key])
+        held        = np.array(held, dtype = bool)
+        legContract = np.array(legContract, dtype = np.intp)
+
+        moves = np.empty((len(legs), self.priceShocks.shape[0]))
+        data  = np.empty((len(legs), 5))
+        moves[held] = self._moves[legContract[held]]
+        data[held]  = self._contracts[legContract[held]]
+        if newRows:
+            newMoves, newData = self.__contract_data(record[newRows])
+            moves[~held] = newMoves[legContract[~held]]
+            data[~held]  = newData[legContract[~held]]
+
+        # Each leg's contribution, as in __rescale, summed by trade
+        quantity = record['Quantity']
+        mult, vega, iv, shock, liqShift = data.T
+        rows    = (mult * quantity)[:, np.newaxis] * moves
+        volRisk = np.abs(quantity * vega * shock * iv * 100)
+        vegaLiq = quantity * vega * liqShift
+
+        trade          = np.array([n for n, leg in legs])
+        nTrades        = len(trades)
+        totalPriceRisk = np.zeros((nTrades, rows.shape[1]))
+        np.add.at(totalPriceRisk, trade, rows)
+        totalPriceRisk += self.totalPriceRisk
+        volTotal = self._volTotal + np.bincount(trade, weights = volRisk,
+                                                minlength = nTrades)
+        netLiq   = self._netLiq + np.bincount(trade, weights = vegaLiq,
+                                              minlength = nTrades)
+        grossLiq = self._grossLiq + np.bincount(trade,
+                   weights = np.abs(vegaLiq), minlength = nTrades)
+        return (totalPriceRisk.min(axis = 1) + volTotal
+                + np.maximum(np.abs(netLiq), 0.2 * grossLiq))
+
+
+## Main
+if __name__ == '__main__':
+    script, fileName = sys.argv[:2]
+    nUpdates = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+
+    portfolio, fieldNames, timestamp = mm.getPortfolio(fileName)
+    book = MarginBook(portfolio)
+    full = mm.calc_margin_result(portfolio, timestamp)
+    print 'Book MAC Margin is %r, full calculation %r.' % (book.macMargin,
+          full.macMargin)
+
+    # A line offsetting the call with the most vega: its vol risk counts
+    # twice in the full calculation and must in the book too
+    calls  = np.flatnonzero(portfolio['CP'] == 1)
+    offset = portfolio[[calls[np.argmax(np.abs(portfolio['Vega'][calls]))]]]
+    offset['Quantity'] *= -1
+    lines  = np.concatenate([portfolio, offset])
+    print 'With an offsetting line: book %r, full calculation %r.' % (
+          MarginBook(lines).macMargin,
+          mm.calc_margin_result(lines, timestamp).macMargin)
+
+    rng     = np.random.RandomState(0)
+    keys    = [position_key(pos) for pos in portfolio]
+    changes = [(keys[i], d) for i, d in zip(rng.randint(len(keys),
+               size = nUpdates), rng.randint(-10, 11, size = nUpdates))]
+
+    time1 = time.time()
+    for key, deltaQuantity in changes:
+        book.change_quantity(key, deltaQuantity)
+        book.macMargin
+    time2 = time.time()
+
+    for key, deltaQuantity in changes:
+        portfolio['Quantity'][keys.index(key)] += deltaQuantity
+    time3 = time.time()
+    full = mm.calc_margin_result(portfolio, timestamp)
+    time4 = time.time()
+
+    drift = book.macMargin
+    book.refresh()
+    print 'After %d updates: book %r (%r before refresh), full %r.' % (
+          nUpdates, book.macMargin, drift, full.macMargin)
+    print 'Incremental update: %0.1f us; full recalculation: %0.1f us.' % (
+          (time2 - time1) / nUpdates * 1e6, (time4 - time3) * 1e6)
+
+    # Candidate trades: a spread between two contracts of the book, one
+    # leg moved a strike away where that makes a new contract
+    options = np.flatnonzero((portfolio['CP'] == 1) | (portfolio['CP'] == 2))
+    trades  = []
+    for n in range(500):
+        legs = portfolio[rng.choice(options, 2)].copy()
+        legs['Quantity'] = [rng.randint(1, 51), -rng.randint(1, 51)]
+        legs['Strike'][1] += rng.choice([0, 5])
+        trades.append(legs)
+    time1   = time.time()
+    margins = book.what_if_trades(trades)
+    time2   = time.time()
+    best    = np.argmin(margins)
+    print '%d candidate trades in %0.1f ms; best %r, MAC Margin %r.' % (
+          len(trades), (time2 - time1) * 1000, best, margins[best])
@@ -0,0 +1,307 @@
+"""
+Streaming MAC margin fed by position and price update messages.
+* Reads newline-delimited JSON messages from a pipe (stdin) or a TCP port,
+  keeps a marginbook.MarginBook up to date and writes one JSON line with
+  the margin after each burst of messages
+* Messages; position fields use the .csv column names, a contract key is
+  [DTE, Strike, C/P] with null for a blank DTE or Strike:
+  - {"type": "fill", "position": {"Strike": ..., "C/P": ..., ...}}
+  - {"type": "quantity", "key": [...], "Quantity": ...}
+  - {"type": "mark", "key": [...], "Theo Price": ..., "Implied Vol": ...}
+  - {"type": "forward", "Forward": ...}, applied to every option
+* Messages arriving within window seconds of the first of a burst are
+  coalesced, so each contract is updated or repriced once per burst and
+  the rest of the book is untouched
+* Each fill is a line of its contract, as a repeated line of the export
+  is; a quantity message makes the contract a single line
+* Bad messages are reported in the burst's line and otherwise ignored
+* Usage: python marginstream.py [window, default 0.05] [port]
+         python marginstream.py replay <position .csv> [messages/s]
+  e.g. python marginstream.py replay position.csv | python marginstream.py
+"""
+
+
+from __future__ import division
+import sys
+import os
+import functools
+import json
+import time
+import socket
+import threading
+import Queue
+from collections import OrderedDict
+import numpy as np
+import macmargin as mm
+import marginbook
+import positions
+
+FIELD_NAMES = dict((header, name) for header, name, fmt
+                   in positions.MARGIN_COLUMNS)
+DTYPE       = np.dtype([(name, fmt) for header, name, fmt
+                        in positions.MARGIN_COLUMNS])
+
+# Running sums are re-added from the rows every so many bursts
+REFRESH_BURSTS = 1000
+READ_SIZE      = 65536
+
+
+def message_key(key):
+    """Contract key of a message, as marginbook.position_key makes it."""
+    dte, strike, cp = key
+    return (None if dte is None else float(dte),
+            None if strike is None else float(strike),
+            int(cp))
+
+
+class MarginStream(object):
+    """Applies bursts of update messages to a MarginBook and publishes the
+    margin after each one."""
+    def __init__(self, book = None, window = 0.05, output = sys.stdout):
+        if book is None:
+            book = marginbook.MarginBook(np.zeros(0, dtype = DTYPE))
+        self.book   = book
+        self.window = window
+        self.output = output
+        self.bursts = 0
+
+    def apply(self, lines):
+        """Apply a burst of message lines to the book. Return the published
+        record and write it to output as a JSON line."""
+        time1   = time.time()
+        pending = {'new' : OrderedDict(), 'quantity' : OrderedDict(),
+                   'marks' : OrderedDict()}
+        errors, messages = [], []
+        for line in lines:
+            try:
+                messages.append((line, json.loads(line)))
+            except Exception as e:
+                errors.append('%s: %s' % (e, line.strip()[:200]))
+        nMessages = len(messages) + len(errors)
+
+        # The burst's fills are parsed in one go; if that fails, one by one
+        fills = [message for line, message in messages
+                 if isinstance(message, dict) and message.get('type') == 'fill']
+        try:
+            records = positions.records_to_positions(
+                      [message['position'] for message in fills])
+        except Exception:
+            records = [None] * len(fills)
+        fillRecords = dict(zip(map(id, fills), records))
+        for line, message in messages:
+            try:
+                self.__collect(message, pending, fillRecords.get(id(message)))
+            except Exception as e:
+                errors.append('%s: %s' % (e, line.strip()[:200]))
+
+        # New contracts enter with their first line, set quantities replace
+        # the lines of a contract and the remaining fills are added as lines
+        book, new  = self.book, pending['new']
+        extraLines = []
+        for key, record in new.items():
+            quantity, fills = pending['quantity'].pop(key)
+            if quantity is None:
+                quantity, fills = fills[0], fills[1:]
+            record['Quantity'] = quantity
+            extraLines.extend((key, fill) for fill in fills)
+        if new:
+            book.add_positions(np.array(new.values(), dtype = book.dtype))
+        book.mark(pending['marks'].items())
+        book.set_quantities([(key, quantity) for key, (quantity, fills)
+                             in pending['quantity'].items()
+                             if quantity is not None])
+        for key, (quantity, fills) in pending['quantity'].items():
+            extraLines.extend((key, fill) for fill in fills)
+        book.add_lines(extraLines)
+
+        self.bursts += 1
+        if self.bursts % REFRESH_BURSTS == 0:
+            book.refresh()
+        return self.publish(nMessages, errors, time.time() - time1)
+
+    def __collect(self, message, pending, record = None):
+        # Fold one message into the burst's pending changes; record is the
+        # parsed position of a fill, if it is at hand
+        kind = message.get('type')
+        if kind == 'fill':
+            if record is None:
+                record = positions.records_to_positions(
+                         [message['position']])[0]
+            key    = marginbook.position_key(record)
+            if key[2] not in (1, 2, 3, 4):
+                raise Exception('Position type not recognized.')
+            if key[2] in (1, 2) and not record['DTE'] > 0:
+                raise Exception('Position %r has expired.' % (key,))
+            if key not in self.book and key not in pending['new']:
+                pending['new'][key] = record.copy()
+                pending['new'][key]['Quantity'] = 0
+            self.__change(pending, key, None, record['Quantity'])
+        elif kind == 'quantity':
+            key = self.__known(message_key(message['key']), pending)
+            self.__change(pending, key, float(message['Quantity']), None)
+        elif kind == 'mark':
+            key    = self.__known(message_key(message['key']), pending)
+            fields = {}
+            for header, value in message.items():
+                if header in ('type', 'key'):
+                    continue
+                name = FIELD_NAMES.get(header)
+                if name is None or name in ('DTE', 'Strike', 'CP',
+                                            'Quantity'):
+                    raise Exception('%s cannot be marked.' % header)
+                fields[name] = np.nan if value is None else float(value)
+            if key in pending['new']:
+                for name, value in fields.items():
+                    pending['new'][key][name] = value
+            else:
+                pending['marks'].setdefault(key, {}).update(fields)
+        elif kind == 'forward':
+            forward = float(message['Forward'])
+            for key in self.book.keys():
+                if key[2] in (1, 2):
+                    pending['marks'].setdefault(key, {})['Forward'] = forward
+            for record in pending['new'].values():
+                if record['CP'] in (1, 2):
+                    record['Forward'] = forward
+        else:
+            raise Exception('Message type %r not recognized.' % kind)
+
+    def __known(self, key, pending):
+        if key not in self.book and key not in pending['new']:
+            raise Exception('Contract %r is not in the book.' % (key,))
+        return key
+
+    def __change(self, pending, key, quantity, fill):
+        # (quantity, fills): a set quantity (None if none was set in the
+        # burst) and the fills that followed it
+        old = pending['quantity'].get(key, (None, []))
+        if quantity is None:
+            pending['quantity'][key] = (old[0], old[1] + [fill])
+        else:
+            pending['quantity'][key] = (quantity, [])
+
+    def publish(self, nMessages, errors = [], seconds = 0):
+        book   = self.book
+        record = OrderedDict([('Time',          time.time()),
+                              ('Messages',      nMessages),
+                              ('Contracts',     len(book)),
+                              ('Price_Risk',    float(book.priceRisk)),
+                              ('Worst_Bucket',  float(book.worstBucket)),
+                              ('Vol_Risk',      float(book.volRisk)),
+                              ('Vega_Liq_Risk', float(book.vegaLiqRisk)),
+                              ('MAC_Margin',    float(book.macMargin)),
+                              ('Seconds',       seconds)])
+        if errors:
+            record['Errors'] = errors
+        if self.output is not None:
+            self.output.write(json.dumps(record) + '\n')
+            self.output.flush()
+        return record
+
+    def consume(self, queue):
+        """Apply the lists of lines put on queue in bursts until a None is
+        put."""
+        while True:
+            lines = queue.get()
+            if lines is None:
+                return
+            burst    = list(lines)
+            deadline = time.time() + self.window
+            while True:
+                try:
+                    lines = queue.get(timeout = max(0, deadline
+                                                    - time.time()))
+                except Queue.Empty:
+                    break
+                if lines is None:
+                    self.apply(burst)
+                    return
+                burst.extend(lines)
+            self.apply(burst)
+
+    def run(self, stream):
+        """Consume messages from a file-like stream until it ends."""
+        queue  = Queue.Queue()
+        read   = functools.partial(os.read, stream.fileno(), READ_SIZE)
+        reader = threading.Thread(target = feed, args = (read, queue, True))
+        reader.daemon = True
+        reader.start()
+        self.consume(queue)
+
+    def serve(self, port, host = ''):
+        """Consume messages from every client connecting to port, until
+        interrupted."""
+        queue    = Queue.Queue()
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((host, port))
+        listener.listen(5)
+
+        def accept():
+            while True:
+                connection, address = listener.accept()
+                read   = functools.partial(connection.recv, READ_SIZE)
+                reader = threading.Thread(target = feed,
+                                          args = (read, queue, False))
+                reader.daemon = True
+                reader.start()
+
+        acceptor = threading.Thread(target = accept)
+        acceptor.daemon = True
+        acceptor.start()
+        self.consume(queue)
+
+
+def feed(read, queue, last):
+    """Put the non-blank lines of what read() returns on queue, a list of
+    whatever has arrived at a time, until read() returns ''; then a None if
+    last."""
+    rest = ''
+    while True:
+        data = read()
+        if not data:
+            break
+        lines = (rest + data).split('\n')
+        rest  = lines.pop()
+        lines = [line for line in lines if line.strip()]
+        if lines:
+            queue.put(lines)
+    if rest.strip():
+        queue.put([rest])
+    if last:
+        queue.put(None)
+
+
+def replay_messages(path_to_csv):
+    """Fill messages, one per position of an export after the expiry roll,
+    as a stand-in feed."""
+    portfolio, fieldNames, timestamp = mm.getPortfolio(path_to_csv)
+    return position_messages(portfolio)
+
+
+def position_messages(portfolio):
+    """Fill messages, one per line of a portfolio."""
+    for pos in portfolio:
+        position = {}
+        for header, name, fmt in positions.MARGIN_COLUMNS:
+            value = pos[name].item()
+            position[header] = None if value != value else value
+        yield {'type' : 'fill', 'position' : position}
+
+
+## Main
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if args[:1] == ['replay']:
+        rate = float(args[2]) if len(args) > 2 else 0
+        for message in replay_messages(args[1]):
+            sys.stdout.write(json.dumps(message) + '\n')
+            if rate:
+                sys.stdout.flush()
+                time.sleep(1 / rate)
+    else:
+        stream = MarginStream(window = float(args[0]) if args else 0.05)
+        if len(args) > 1:
+            stream.serve(int(args[1]))
+        else:
+            stream.run(sys.stdin)
@@ -0,0 +1,227 @@
+# cython: language_level=2, boundscheck=False, wraparound=False, cdivision=True
+"""
+Typed Black model kernel used by the *_array functions in _optionpricing_core.
+* Inputs are contiguous float64 arrays of equal length
+* YTE is defined as YEARS to expiration, option type is 1 (call) or 2 (put)
+* Results are written into caller-provided arrays with the GIL released
+* Semantics follow the NumPy implementations in _optionpricing_core
+* grid_*price_array interpolate in a pricegrid.PriceGrid
+"""
+
+from libc.math cimport erfc, exp, log, sqrt, fabs, NAN
+
+cdef double PI      = 3.141592653589793
+cdef double SQRT2   = sqrt(2.0)
+cdef double SQRT2PI = sqrt(2.0 * PI)
+
+
+cdef inline double norm_cdf(double x) nogil:
+    return erfc(-x / SQRT2) / 2
+
+cdef inline double norm_pdf(double x) nogil:
+    return exp(-x*x/2) / SQRT2PI
+
+cdef inline double intrinsic(double forward, double strike,
+                             double oType) nogil:
+    if oType == 1:
+        return forward - strike if forward > strike else 0
+    elif oType == 2:
+        return strike - forward if forward < strike else 0
+    return NAN
+
+cdef inline double price_vega(double forward, double strike, double iv,
+                              double yte, double oType, double *vega) nogil:
+    """Black price. Vega per unit of vol is written to vega unless it is
+    NULL."""
+    cdef double sqrtT, lnFK, d1, d2
+
+    if vega != NULL:
+        vega[0] = 0
+    if iv <= 0 or yte <= 0:
+        return intrinsic(forward, strike, oType)
+
+    sqrtT = sqrt(yte)
+    lnFK  = log(forward/strike) / (iv * sqrtT)
+    d1    = lnFK + iv/2 * sqrtT
+    d2    = lnFK - iv/2 * sqrtT
+    if vega != NULL:
+        vega[0] = forward * norm_pdf(d1) * sqrtT
+
+    if oType == 1:
+        return forward * norm_cdf(d1) - strike * norm_cdf(d2)
+    elif oType == 2:
+        return strike * (1 - norm_cdf(d2)) - forward *(1 - norm_cdf(d1))
+    return NAN
+
+
+def price_array(double[::1] forward, double[::1] strike, double[::1] iv,
+                double[::1] yte, double[::1] oType, double[::1] price):
+    cdef Py_ssize_t i, n = forward.shape[0]
+
+    with nogil:
+        for i in range(n):
+            price[i] = price_vega(forward[i], strike[i], iv[i], yte[i],
+                                  oType[i], NULL)
+
+
+def all_array(double[::1] forward, double[::1] strike, double[::1] iv,
+              double[::1] yte, double[::1] oType, double[:, ::1] out):
+    """Rows of out are price, delta, gamma, vega, theta, charm."""
+    cdef Py_ssize_t i, n = forward.shape[0]
+    cdef double F, K, v, t, sqrtT, lnFK, d1, d2, pdf1, x1, x2
+
+    with nogil:
+        for i in range(n):
+            F, K, v, t = forward[i], strike[i], iv[i], yte[i]
+
+            if v <= 0 or t <= 0:
+                out[0, i] = intrinsic(F, K, oType[i])
+                if oType[i] == 1:
+                    out[1, i] = 1 if F > K else 0
+                elif oType[i] == 2:
+                    out[1, i] = -1 if F < K else 0
+                else:
+                    out[1, i] = NAN
+                out[2, i] = 0
+                out[3, i] = 0
+                out[4, i] = 0
+                out[5, i] = 0
+                continue
+
+            sqrtT = sqrt(t)
+            lnFK  = log(F/K) / (v * sqrtT)
+            d1    = lnFK + v/2 * sqrtT
+            d2    = lnFK - v/2 * sqrtT
+            pdf1  = norm_pdf(d1)
+            x1    = norm_cdf(d1)
+            x2    = norm_cdf(d2)
+
+            if oType[i] == 1:
+                out[0, i] = F * x1 - K * x2
+                out[1, i] = x1
+            elif oType[i] == 2:
+                out[0, i] = K * (1 - x2) - F *(1 - x1)
+                out[1, i] = x1 - 1
+            else:
+                out[0, i] = NAN
+                out[1, i] = NAN
+            out[2, i] = pdf1 / (F * v * sqrtT)
+            out[3, i] = F * pdf1 * sqrtT / 100
+            out[4, i] = -F * pdf1 * v / (2*sqrtT)
+            out[5, i] = -pdf1 * (-d2 * v * sqrtT) / (2 * t * v* sqrtT)
+
+
+def impliedvol_array(double[::1] forward, double[::1] strike,
+                     double[::1] yte, double[::1] oType,
+                     double[::1] actualPrice, double tol, Py_ssize_t maxIter,
+                     double[::1] vol, unsigned char[::1] converged,
+                     Py_ssize_t[::1] nIter):
+    """Corrado-Miller guess, then Newton steps on vega safeguarded by
+    bisection of [0, 10], as in _optionpricing_core.calc_impliedvol."""
+    cdef Py_ssize_t i, n = forward.shape[0]
+    cdef double F, K, t, target, call, half, root, v, lb, ub, price, vega
+
+    with nogil:
+        for i in range(n):
+            F, K, t, target = forward[i], strike[i], yte[i], actualPrice[i]
+            converged[i] = 0
+            nIter[i]     = 0
+            if oType[i] != 1 and oType[i] != 2:
+                vol[i] = NAN
+                continue
+
+            call = target if oType[i] == 1 else target + F - K
+            half = call - (F - K) / 2
+            root = half*half - (F - K)*(F - K) / PI
+            root = sqrt(root) if root > 0 else 0
+            v    = sqrt(2 * PI / t) / (F + K) * (half + root)
+
+            lb, ub = 0, 10
+            if not (v > lb and v < ub):
+                v = (lb + ub) / 2
+
+            while nIter[i] < maxIter:
+                price     = price_vega(F, K, v, t, oType[i], &vega)
+                nIter[i] += 1
+                if fabs(target - price) <= tol:
+                    converged[i] = 1
+                    break
+
+                if price <= target:
+                    lb = v
+                else:
+                    ub = v
+
+                v = v - (price - target) / vega
+                if not (v > lb and v < ub):
+                    v = (lb + ub) / 2
+            vol[i] = v
+
+
+cdef inline double grid_price(double[:, ::1] calls, double kMin, double invDk,
+                              double F, double K, double v, double t,
+                              double oType, double k, double y) nogil:
+    """Bilinear interpolation in pricegrid.PriceGrid's calls, or the exact
+    price outside it. y is the fractional total vol index."""
+    cdef Py_ssize_t i, j
+    cdef double x, fx, fy, call
+    cdef Py_ssize_t nK = calls.shape[0], nW = calls.shape[1]
+
+    x = (k - kMin) * invDk
+    if not (v > 0 and t > 0 and x >= 0 and x <= nK - 1
+            and y >= 0 and y <= nW - 1):
+        return price_vega(F, K, v, t, oType, NULL)
+
+    i = <Py_ssize_t>x
+    j = <Py_ssize_t>y
+    if i > nK - 2:
+        i = nK - 2
+    if j > nW - 2:
+        j = nW - 2
+    fx, fy = x - i, y - j
+    call = F * ((calls[i, j] * (1 - fx) + calls[i + 1, j] * fx) * (1 - fy)
+                + (calls[i, j + 1] * (1 - fx) + calls[i + 1, j + 1] * fx) * fy)
+    if oType == 1:
+        return call
+    elif oType == 2:
+        return call - F + K
+    return NAN
+
+
+def grid_price_array(double[::1] forward, double[::1] strike, double[::1] iv,
+                     double[::1] yte, double[::1] oType,
+                     double[:, ::1] calls, double kMin, double invDk,
+                     double wMin, double invDw, double[::1] price):
+    """Interpolated prices; see pricegrid.PriceGrid."""
+    cdef Py_ssize_t i, n = forward.shape[0]
+    cdef double y
+
+    with nogil:
+        for i in range(n):
+            y = (iv[i] * sqrt(yte[i]) - wMin) * invDw
+            price[i] = grid_price(calls, kMin, invDk, forward[i], strike[i],
+                                  iv[i], yte[i], oType[i],
+                                  log(strike[i] / forward[i]), y)
+
+
+def grid_shocked_price_array(double[::1] forward, double[::1] strike,
+                             double[::1] iv, double[::1] yte,
+                             double[::1] oType, double[::1] shocks,
+                             double[::1] logShocks, double[:, ::1] calls,
+                             double kMin, double invDk,
+                             double wMin, double invDw,
+                             double[:, ::1] price):
+    """price[i, j] at forward[i] * shocks[j], with logShocks = log(shocks);
+    log-moneyness and total vol are worked out once per option."""
+    cdef Py_ssize_t i, j, n = forward.shape[0], m = shocks.shape[0]
+    cdef double k, y
+
+    with nogil:
+        for i in range(n):
+            k = log(strike[i] / forward[i])
+            y = (iv[i] * sqrt(yte[i]) - wMin) * invDw
+            for j in range(m):
+                price[i, j] = grid_price(calls, kMin, invDk,
+                                         forward[i] * shocks[j], strike[i],
+                                         iv[i], yte[i], oType[i],
+                                         k - logShocks[j], y)
@@ -0,0 +1,280 @@
+"""
+Reads position .csv files exported by Franz_ExportPosition into NumPy
+structured arrays.
+* Only the columns the margin calculation uses are parsed (MARGIN_COLUMNS)
+* Columns get explicit dtypes: int8 for the position type, float64 otherwise
+* Blank cells (e.g. the Strike of the stock line) are read as nan
+* Large files are parsed in chunks of rows
+* parse_positions/records_to_positions read .csv text and dict records,
+  e.g. the body of a margin request
+* A columnar store (STORE_SUFFIX) holds a book as one binary array per
+  field after a small header with the schema and timestamp; open_store maps
+  it without parsing or copying, so processes reading it share the same
+  pages. read_store, and so the margin calculation, copies the mapped
+  columns once into a structured array: no text is parsed, but the book is
+  not zero-copy (a structured view over separate columns would copy a
+  record the width of the file on every row gather). convert_to_store
+  makes one from an export
+* Run this module on an export to benchmark it against np.genfromtxt, or
+  as positions.py convert <position .csv> ... to write stores
+"""
+
+
+from __future__ import division
+import os.path
+import re
+import itertools
+import json
+import struct
+import tempfile
+from collections import OrderedDict
+import numpy as np
+
+# (.csv header, field name, dtype); field names match what np.genfromtxt
+# used to produce, so the rest of the code is unaffected
+MARGIN_COLUMNS = [('Strike',      'Strike',      np.float64),
+                  ('C/P',         'CP',          np.int8),
+                  ('Quantity',    'Quantity',    np.float64),
+                  ('Implied Vol', 'Implied_Vol', np.float64),
+                  ('Theo Price',  'Theo_Price',  np.float64),
+                  ('Delta',       'Delta',       np.float64),
+                  ('Vega',        'Vega',        np.float64),
+                  ('DTE',         'DTE',         np.float64),
+                  ('Forward',     'Forward',     np.float64),
+                  ('Multiplier',  'Multiplier',  np.float64)]
+
+CHUNK_SIZE = 65536
+
+# Columnar store: magic, header size (little-endian uint64), JSON header
+# padded with spaces, then the columns, each starting on a STORE_ALIGN
+# boundary
+STORE_SUFFIX = '.pcol'
+STORE_MAGIC  = 'MACPOS\x00\x01'
+STORE_ALIGN  = 64
+
+
+def read_positions(path_to_csv, columns = MARGIN_COLUMNS,
+                   chunkSize = CHUNK_SIZE):
+    """Read a position .csv into a structured array with one field per
+    entry of columns."""
+    chunks = list(iter_positions(path_to_csv, columns, chunkSize))
+    if len(chunks) == 1:
+        return chunks[0]
+    return np.concatenate(chunks)
+
+
+def iter_positions(path_to_csv, columns = MARGIN_COLUMNS,
+                   chunkSize = CHUNK_SIZE):
+    """Yield the positions of a .csv as structured arrays of at most
+    chunkSize rows each."""
+    with open(path_to_csv, 'rU') as inFile:
+        for chunk in iter_position_lines(inFile, columns, chunkSize,
+                                         path_to_csv):
+            yield chunk
+
+
+def iter_position_lines(lines, columns = MARGIN_COLUMNS,
+                        chunkSize = CHUNK_SIZE, source = 'input'):
+    """iter_positions for any iterable of .csv lines ending in '\\n', the
+    header line first."""
+    dtype = np.dtype([(name, fmt) for header, name, fmt in columns])
+    lines = iter(lines)
+
+    header  = next(lines, '').rstrip('\n').split(',')
+    missing = [c[0] for c in columns if c[0] not in header]
+    if missing:
+        raise Exception('Columns %r not found in %s.' % (missing, source))
+    colIdx  = [header.index(c[0]) for c in columns]
+
+    yieldedRows = False
+    while True:
+        chunk = [line for line in itertools.islice(lines, chunkSize)
+                 if line.strip()]
+        if not chunk:
+            break
+        yield __parse_chunk(chunk, colIdx, len(header), dtype)
+        yieldedRows = True
+
+    if not yieldedRows:
+        yield np.zeros(0, dtype = dtype)
+
+
+def parse_positions(text, columns = MARGIN_COLUMNS):
+    """Read the text of a position .csv (e.g. a request body) into a
+    structured array."""
+    lines  = text.replace('\r\n', '\n').replace('\r', '\n').splitlines(True)
+    chunks = list(iter_position_lines(lines, columns, CHUNK_SIZE, 'text'))
+    if len(chunks) == 1:
+        return chunks[0]
+    return np.concatenate(chunks)
+
+
+def records_to_positions(records, columns = MARGIN_COLUMNS):
+    """Convert a list of dicts keyed by .csv header (e.g. parsed JSON) into
+    a structured array; missing, None or '' values are read as nan."""
+    dtype = np.dtype([(name, fmt) for header, name, fmt in columns])
+    chunk = np.empty(len(records), dtype = dtype)
+    for header, name, fmt in columns:
+        if records and not any(header in r for r in records):
+            raise Exception('Column %r not found in records.' % header)
+        chunk[name] = np.fromiter((np.nan if r.get(header) in (None, '')
+                                   else float(r[header]) for r in records),
+                                  np.float64, len(records))
+    return chunk
+
+
+def __parse_chunk(lines, colIdx, nCols, dtype):
+    # Split the whole chunk at once; column i is then every nCols-th cell
+    nRows = len(lines)
+    if not lines[-1].endswith('\n'):
+        lines[-1] += '\n'
+    cells = ''.join(lines).replace('\n', ',').split(',')
+    if len(cells) != nRows * nCols + 1:
+        raise Exception('Rows do not all have %d fields.' % nCols)
+
+    chunk = np.empty(nRows, dtype = dtype)
+    for idx, name in zip(colIdx, dtype.names):
+        chunk[name] = np.fromiter((float(x) if x else np.nan
+                                   for x in cells[idx:nRows * nCols:nCols]),
+                                  np.float64, nRows)
+    return chunk
+
+
+def extract_timestamp(path_to_csv):
+    """Return the '_YYYYMMDD_HHMM' timestamp from an export file name such
+    as position_s12_20161202_1529.csv, or '' if there is none."""
+    matches = re.findall(r'_\d{8}_\d{4,6}(?!\d)',
+                         os.path.basename(path_to_csv))
+    return matches[-1] if matches else ''
+
+
+def write_store(portfolio, path, timestamp = ''):
+    """Save a portfolio as a columnar store. The file is written under a
+    temporary name and renamed into place, so a process that has the old
+    file mapped keeps a consistent view of it."""
+    nRows   = portfolio.shape[0]
+    columns = []
+    offset  = 0
+    for name in portfolio.dtype.names:
+        dtype = portfolio.dtype[name].newbyteorder('<')
+        columns.append({'name' : name, 'dtype' : dtype.str, 
+                        'offset' : offset})
+        offset += __align(nRows * dtype.itemsize)
+    header = json.dumps({'rows' : nRows, 'timestamp' : timestamp,
+                         'columns' : columns})
+    headerSize = __align(16 + len(header))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmpPath = tempfile.mkstemp(dir = directory, suffix = '.tmp')
+    with os.fdopen(fd, 'wb') as outFile:
+        outFile.write(STORE_MAGIC + struct.pack('<Q', headerSize))
+        outFile.write(header.ljust(headerSize - 16))
+        for column in columns:
+            data = np.ascontiguousarray(portfolio[column['name']],
+                                        dtype = column['dtype']).tostring()
+            outFile.write(data + '\0' * (__align(len(data)) - len(data)))
+    os.chmod(tmpPath, 0o644)
+    os.rename(tmpPath, path)
+
+
+def open_store(path):
+    """Map a columnar store read-only. Return (columns, timestamp), columns
+    being an OrderedDict of field name to np.memmap; nothing is read until
+    it is used."""
+    with open(path, 'rb') as inFile:
+        if inFile.read(8) != STORE_MAGIC:
+            raise Exception('%s is not a position store.' % path)
+        headerSize = struct.unpack('<Q', inFile.read(8))[0]
+        header     = json.loads(inFile.read(headerSize - 16))
+
+    nRows   = header['rows']
+    columns = OrderedDict()
+    for column in header['columns']:
+        if nRows:
+            columns[column['name']] = np.memmap(path, column['dtype'], 'r',
+                                      headerSize + column['offset'], nRows)
+        else:
+            columns[column['name']] = np.zeros(0, column['dtype'])
+    return columns, str(header['timestamp'])
+
+
+def read_store(path, columns = MARGIN_COLUMNS):
+    """Read a columnar store into a structured array with one field per
+    entry of columns. Return it and the store's timestamp. The array is a
+    copy of the mapped columns (see open_store for the columns alone)."""
+    stored, timestamp = open_store(path)
+    missing = [name for header, name, fmt in columns if name not in stored]
+    if missing:
+        raise Exception('Columns %r not found in %s.' % (missing, path))
+
+    dtype     = np.dtype([(name, fmt) for header, name, fmt in columns])
+    nRows     = len(stored.values()[0]) if stored else 0
+    portfolio = np.empty(nRows, dtype = dtype)
+    for name in dtype.names:
+        portfolio[name] = stored[name]
+    return portfolio, timestamp
+
+
+def convert_to_store(path_to_csv, path = None, columns = MARGIN_COLUMNS):
+    """Write a position .csv as a columnar store, by default next to it
+    with STORE_SUFFIX. Return the store's path."""
+    if path is None:
+        path = os.path.splitext(path_to_csv)[0] + STORE_SUFFIX
+    write_store(read_positions(path_to_csv, columns), path,
+                extract_timestamp(path_to_csv))
+    return path
+
+
+def __align(nBytes):
+    return -(-nBytes // STORE_ALIGN) * STORE_ALIGN
+
+
+## Main
+if __name__ == '__main__':
+    import sys
+    import time
+
+    if sys.argv[1] == 'convert':
+        for fileName in sys.argv[2:]:
+            print 'Wrote %s.' % convert_to_store(fileName)
+        sys.exit(0)
+
+    script, fileName = sys.argv[:2]
+    nRows = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+
+    # Tile the export's rows up to nRows to build a large book
+    with open(fileName, 'rU') as inFile:
+        header = inFile.readline()
+        rows   = [line for line in inFile if line.strip()]
+    bigFile = tempfile.NamedTemporaryFile(suffix = '.csv', delete = False)
+    bigFile.write(header)
+    for i in range(nRows):
+        bigFile.write(rows[i % len(rows)])
+    bigFile.close()
+
+    try:
+        time1 = time.time()
+        ours = read_positions(bigFile.name)
+        time2 = time.time()
+        theirs = np.genfromtxt(bigFile.name, dtype = float, delimiter = ',',
+                               names = True)
+        time3 = time.time()
+        storePath = convert_to_store(bigFile.name)
+        time4 = time.time()
+        stored, timestamp = read_store(storePath)
+        time5 = time.time()
+    finally:
+        os.remove(bigFile.name)
+        if os.path.isfile(bigFile.name[:-4] + STORE_SUFFIX):
+            os.remove(bigFile.name[:-4] + STORE_SUFFIX)
+
+    for header, name, fmt in MARGIN_COLUMNS:
+        assert np.allclose(ours[name], theirs[name], rtol = 0, atol = 0,
+                           equal_nan = True), name
+    print 'read_positions: %0.3f s for %d rows (%d bytes/row).' % (
+          time2 - time1, nRows, ours.dtype.itemsize)
+    print 'np.genfromtxt:  %0.3f s for %d rows (%d bytes/row).' % (
+          time3 - time2, nRows, theirs.dtype.itemsize)
+    assert stored.tostring() == ours.tostring()
+    print 'read_store:     %0.3f s for %d rows (conversion %0.3f s).' % (
+          time5 - time4, nRows, time4 - time3)
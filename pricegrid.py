@@ -0,0 +1,225 @@
+"""
+Approximate Black prices by interpolation in a precomputed grid.
+* A Black call is forward * c(k, w) with k = log(strike/forward) and total
+  vol w = iv * sqrt(YTE), so one grid of c over (k, w) serves every expiry;
+  puts follow from put-call parity
+* The grid is filled with _optionpricing_core.calc_price_array and read by
+  bilinear interpolation
+* Error bound: |price - Black price| <= forward * maxError, where maxError
+  is measured when the grid is built, at the centre of every cell (where the
+  bilinear error peaks)
+* Options outside the grid (k outside [kMin, kMax], total vol below wMin or
+  above wMax, expired) are priced exactly; hit_rate gives the share of
+  prices read from the grid
+* The default grid spans |k| <= 1.5, options near the money. grid_covering
+  builds a grid over the k and w a set of options actually has, e.g. the
+  margin calculation's, which prices off Theo_Price and so has strikes
+  many times its forwards
+* With the typed kernel built, the lookups run in optionpricing_kernel; the
+  NumPy version is the fallback
+* Pass a PriceGrid as priceGrid to macmargin.calc_pricerisk or
+  scenarios.calc_scenarios; run this module to print its error and speed
+"""
+
+from __future__ import division
+import numpy as np
+import _optionpricing_core as core
+from _optionpricing_core import CALL, PUT
+
+
+class PriceGrid(object):
+    """Grid of undiscounted Black call prices per unit forward over
+    log-moneyness k in [kMin, kMax] (kMin defaults to -kMax) and total vol
+    w in [wMin, wMax]."""
+    def __init__(self, kMax = 1.5, wMin = 0.02, wMax = 2.0, nK = 1201,
+                 nW = 800, kMin = None):
+        if kMin is None:
+            kMin = -kMax
+        self.k  = np.linspace(kMin, kMax, nK)
+        self.w  = np.linspace(wMin, wMax, nW)
+        self.dk = self.k[1] - self.k[0]
+        self.dw = self.w[1] - self.w[0]
+        self.calls = self.__exact_calls(self.k[:, np.newaxis],
+                                        self.w[np.newaxis, :])
+
+        # Largest interpolation error, at the cell centres
+        kMid = (self.k[:-1] + self.k[1:]) / 2
+        wMid = (self.w[:-1] + self.w[1:]) / 2
+        exact  = self.__exact_calls(kMid[:, np.newaxis], wMid[np.newaxis, :])
+        interp = self.__interpolate(
+                 np.repeat(np.arange(nK - 1) + 0.5, nW - 1),
+                 np.tile(np.arange(nW - 1) + 0.5, nK - 1))
+        self.maxError = np.abs(interp - exact.ravel()).max()
+
+    def __exact_calls(self, k, w):
+        return core.calc_price_array(1.0, np.exp(k), w, 1.0, CALL)
+
+    def __interpolate(self, x, y):
+        # x, y are fractional grid indices, clipped to the grid
+        nW = self.w.shape[0]
+        i  = np.minimum(x.astype(np.intp), self.k.shape[0] - 2)
+        j  = np.minimum(y.astype(np.intp), nW - 2)
+        fx = x - i
+        fy = y - j
+        c  = self.calls.ravel()
+        ij = i * nW + j
+        return ((c[ij] * (1 - fx) + c[ij + nW] * fx) * (1 - fy)
+                + (c[ij + 1] * (1 - fx) + c[ij + nW + 1] * fx) * fy)
+
+    def calc_price_array(self, forward, strike, iv, yte, oType):
+        """Same arguments and result as core.calc_price_array."""
+        if core.USE_KERNEL:
+            shape, args = core.kernel_inputs(forward, strike, iv, yte,
+                                             core.normalize_otype_array(oType))
+            price = np.empty(args[0].size)
+            core._kernel.grid_price_array(*(args + self.__kernel_grid() 
+                                            + [price]))
+            return price.reshape(shape)
+
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            k = np.log(np.asarray(strike, dtype = float) / forward)
+            w = iv * np.sqrt(yte)
+        return self.__price(forward, strike, iv, yte, oType, k, w)
+
+    def calc_shocked_price_array(self, forward, priceShocks, strike, iv, yte,
+                                 oType):
+        """Prices at forward * (1 + priceShocks) for 1-D arrays of options:
+        rows = options, cols = price shocks. Log-moneyness and total vol are
+        worked out per option and per shock, not per cell."""
+        shocks = 1 + np.asarray(priceShocks, dtype = float)
+        if core.USE_KERNEL:
+            shape, args = core.kernel_inputs(forward, strike, iv, yte,
+                                             core.normalize_otype_array(oType))
+            price = np.empty((args[0].size, shocks.shape[0]))
+            core._kernel.grid_shocked_price_array(*(args + [shocks, 
+                np.log(shocks)] + self.__kernel_grid() + [price]))
+            return price
+
+        col = lambda a: np.asarray(a, dtype = float)[:, np.newaxis]
+        forward, strike, iv, yte = col(forward), col(strike), col(iv), col(yte)
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            k = np.log(strike / forward) - np.log(shocks)
+            w = iv * np.sqrt(yte)
+        return self.__price(forward * shocks, strike, iv, yte,
+                            col(core.normalize_otype_array(oType)), k, w)
+
+    def hit_rate(self, forward, priceShocks, strike, iv, yte):
+        """Share of the prices calc_shocked_price_array would read from the
+        grid rather than price exactly."""
+        k, w = shocked_moneyness(forward, priceShocks, strike, iv, yte)
+        with np.errstate(invalid = 'ignore'):
+            inside = ((k >= self.k[0]) & (k <= self.k[-1])
+                      & (w >= self.w[0]) & (w <= self.w[-1])
+                      & (np.asarray(yte) > 0)[:, np.newaxis]
+                      & (np.asarray(iv) > 0)[:, np.newaxis])
+        return inside.mean() if inside.size else 0.0
+
+    def __kernel_grid(self):
+        return [self.calls, self.k[0], 1 / self.dk, self.w[0], 1 / self.dw]
+
+    def __price(self, forward, strike, iv, yte, oType, k, w):
+        oType = core.normalize_otype_array(oType)
+        nK, nW = self.k.shape[0], self.w.shape[0]
+        with np.errstate(invalid = 'ignore'):
+            x = (k - self.k[0]) * (1 / self.dk)
+            y = (w - self.w[0]) * (1 / self.dw)
+            inside = (((y >= 0) & (y <= nW - 1) & (yte > 0) & (iv > 0))
+                      & (x >= 0) & (x <= nK - 1))
+        x = np.clip(x, 0, nK - 1)
+        y = np.clip(y, 0, nW - 1)
+        x = np.where(np.isnan(x), 0, x)
+        y = np.where(np.isnan(y), 0, y)
+
+        forward, strike, oType = np.broadcast_arrays(forward, strike, oType)
+        call  = forward * self.__interpolate(x, y)
+        price = np.where(oType == CALL, call,
+                np.where(oType == PUT, call - forward + strike, np.nan))
+
+        outside = ~inside
+        if outside.any():
+            iv, yte = np.broadcast_arrays(iv, yte, forward)[:2]
+            price[outside] = core.calc_price_array(forward[outside],
+                             strike[outside], iv[outside], yte[outside],
+                             oType[outside])
+        return price
+
+
+def shocked_moneyness(forward, priceShocks, strike, iv, yte):
+    """Log-moneyness k and total vol w of 1-D arrays of options under every
+    price shock, as calc_shocked_price_array works them out: rows = options,
+    cols = price shocks."""
+    col    = lambda a: np.asarray(a, dtype = float)[:, np.newaxis]
+    shocks = 1 + np.asarray(priceShocks, dtype = float)
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        k = np.log(col(strike) / col(forward)) - np.log(shocks)
+        w = col(iv) * np.sqrt(col(yte)) + 0 * k
+    return k, w
+
+
+def grid_covering(forward, priceShocks, strike, iv, yte, nK = 1201,
+                  nW = 800):
+    """PriceGrid over the range of k and w of 1-D arrays of options under
+    every price shock; options the grid cannot price (expired, zero or
+    negative vol, zero forward) are left out of the range."""
+    k, w = shocked_moneyness(forward, priceShocks, strike, iv, yte)
+    with np.errstate(invalid = 'ignore'):
+        use = np.isfinite(k) & np.isfinite(w) & (w > 0)
+    if not use.any():
+        return PriceGrid()
+    k, w = k[use], w[use]
+    return PriceGrid(kMin = k.min(), kMax = max(k.max(), k.min() + 1e-6),
+                     wMin = w.min(), wMax = max(w.max(), w.min() + 1e-6),
+                     nK = nK, nW = nW)
+
+
+if __name__ == '__main__':
+    import time
+
+    time1 = time.time()
+    grid  = PriceGrid()
+    time2 = time.time()
+    print 'Grid of %d x %d built in %0.3f s; max error %.2e x forward.' % (
+          grid.k.shape[0], grid.w.shape[0], time2 - time1, grid.maxError)
+
+    rng     = np.random.RandomState(0)
+    n       = 2000000
+    forward = rng.uniform(1500, 3000, n)
+    strike  = np.round(forward * rng.uniform(0.5, 1.5, n) / 5) * 5
+    iv      = rng.uniform(0.05, 0.8, n)
+    yte     = rng.uniform(1, 800, n) / 365
+    oType   = rng.randint(1, 3, n)
+
+    time1  = time.time()
+    approx = grid.calc_price_array(forward, strike, iv, yte, oType)
+    time2  = time.time()
+    exact  = core.calc_price_array(forward, strike, iv, yte, oType)
+    time3  = time.time()
+    core.USE_KERNEL, useKernel = False, core.USE_KERNEL
+    core.calc_price_array(forward, strike, iv, yte, oType)
+    time4  = time.time()
+    core.USE_KERNEL = useKernel
+
+    err = np.abs(approx - exact) / forward
+    print 'Max error on %d random options %.2e x forward (bound %.2e).' % (
+          n, err.max(), grid.maxError)
+    print 'Grid %0.3f s, kernel %0.3f s, NumPy %0.3f s.' % (time2 - time1,
+          time3 - time2, time4 - time3)
+
+    # The margin case: every option under the 23 MAC price shocks
+    import macmargin as mm
+    priceShocks, nShocks = mm.define_priceshocks()
+    n = n // nShocks
+    forward, strike, iv, yte, oType = [a[:n] for a in (forward, strike, iv,
+                                                       yte, oType)]
+    shocked = forward[:, np.newaxis] * (1 + np.asarray(priceShocks))
+    time1  = time.time()
+    approx = grid.calc_shocked_price_array(forward, priceShocks, strike, iv,
+                                           yte, oType)
+    time2  = time.time()
+    exact  = core.calc_price_array(shocked, strike[:, np.newaxis],
+             iv[:, np.newaxis], yte[:, np.newaxis], oType[:, np.newaxis])
+    time3  = time.time()
+    err = np.abs(approx - exact) / shocked
+    print '%d options x %d shocks: max error %.2e x forward; grid %0.3f s, '\
+          'kernel %0.3f s.' % (n, nShocks, err.max(), time2 - time1,
+          time3 - time2)
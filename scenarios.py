@@ -0,0 +1,143 @@
+"""
+Scenario engine: P&L of a portfolio over a grid of
+price shocks x vol shifts x days forward.
+* A grid is any combination of the three axes, see make_grid; MAC_GRID is
+  the 23 MAC price shocks alone and STRESS_GRID the -50%..+50% price grid
+  of Franz_MAC_Risk with vol and time moves added
+* Vol shifts are absolute changes of implied vol (0.05 = 5 vol points),
+  floored at zero; days forward are taken off DTE, and options that expire
+  inside the horizon are worth their intrinsic value
+* Each block of positions is priced over the whole grid in one broadcast
+  call; blocks keep the cube under maxCells values at a time
+* Returns the scenario totals, the worst loss and where it happened, and
+  optionally the full positions x grid P&L cube
+* With a pricegrid.PriceGrid as priceGrid, options are repriced by
+  interpolation instead of exactly
+* Usage: python scenarios.py <position .csv> [mac|stress]
+"""
+
+
+from __future__ import division
+import sys
+import time
+from collections import namedtuple
+import numpy as np
+import macmargin as mm
+import _optionpricing_dte as bs
+
+MAC_PRICE_SHOCKS    = mm.define_priceshocks()[0]
+STRESS_PRICE_SHOCKS = [-0.50, -0.45, -0.40, -0.35, -0.30, -0.25,
+                       -0.20, -0.175, -0.15, -0.125, -0.10, -0.08,
+                       -0.06,  -0.04, -0.03,  -0.02, -0.01,     0,
+                        0.01,   0.02,  0.03,   0.04,  0.06,  0.08,
+                        0.10,  0.125,  0.15,  0.175,  0.20,  0.25,
+                        0.30,   0.35,  0.40,   0.45,  0.50]
+
+ScenarioGrid   = namedtuple('ScenarioGrid',
+                            ['priceShocks', 'volShifts', 'daysForward'])
+ScenarioResult = namedtuple('ScenarioResult',
+                            ['grid', 'totals', 'worstLoss', 'worstScenario',
+                             'pnl'])
+
+
+def make_grid(priceShocks = MAC_PRICE_SHOCKS, volShifts = [0],
+              daysForward = [0]):
+    """Build a ScenarioGrid of float arrays from three lists."""
+    return ScenarioGrid(np.asarray(priceShocks, dtype = float),
+                        np.asarray(volShifts,   dtype = float),
+                        np.asarray(daysForward, dtype = float))
+
+MAC_GRID    = make_grid()
+STRESS_GRID = make_grid(STRESS_PRICE_SHOCKS, [-0.05, 0, 0.05, 0.10],
+                        [0, 1, 5])
+
+
+def calc_scenarios(portfolio, grid = MAC_GRID, keepCube = False,
+                   maxCells = 4000000, priceGrid = None):
+    """Accept a portfolio and a ScenarioGrid. Return a ScenarioResult:
+    totals has shape (price shocks, vol shifts, days forward), worstScenario
+    is the (price shock, vol shift, days forward) of the smallest total and
+    pnl is the (positions, ...) cube if keepCube, else None."""
+    cp = portfolio['CP']
+    if not np.all((cp == 1) | (cp == 2) | (cp == 3) | (cp == 4)):
+        raise Exception('Position type not recognized.')
+
+    shape     = tuple(len(axis) for axis in grid)
+    nPos      = portfolio.shape[0]
+    blockSize = max(1, maxCells // int(np.prod(shape)))
+
+    totals = np.zeros(shape)
+    cube   = np.empty((nPos,) + shape) if keepCube else None
+    for start in range(0, nPos, blockSize):
+        pnl = calc_scenario_pnl(portfolio[start:start + blockSize], grid,
+                                priceGrid)
+        totals += pnl.sum(axis = 0)
+        if keepCube:
+            cube[start:start + blockSize] = pnl
+
+    worstIdx      = np.unravel_index(np.argmin(totals), shape)
+    worstScenario = tuple(axis[i] for axis, i in zip(grid, worstIdx))
+    return ScenarioResult(grid, totals, totals[worstIdx], worstScenario, cube)
+
+
+def calc_scenario_pnl(portfolio, grid, priceGrid = None):
+    """Accept a portfolio and a ScenarioGrid. Return the P&L cube:
+    positions x price shocks x vol shifts x days forward."""
+    cp       = portfolio['CP']
+    isOption = (cp == 1) | (cp == 2)
+    shape    = (portfolio.shape[0],) + tuple(len(axis) for axis in grid)
+
+    def column(name, idx):
+        return portfolio[name][idx, np.newaxis, np.newaxis, np.newaxis]
+
+    shocks   = 1 + grid.priceShocks[:, np.newaxis, np.newaxis]
+    theo     = column('Theo_Price', slice(None))
+    newPrice = np.empty(shape)
+    newPrice[...] = theo * shocks
+
+    optIdx = np.flatnonzero(isOption)
+    iv     = np.maximum(column('Implied_Vol', optIdx)
+                        + grid.volShifts[:, np.newaxis], 0)
+    dte    = column('DTE', optIdx) - grid.daysForward
+    if priceGrid is None:
+        newPrice[optIdx] = bs.calc_price_array(newPrice[optIdx],
+                           column('Strike', optIdx), iv, dte,
+                           column('CP', optIdx))
+    else:
+        newPrice[optIdx] = priceGrid.calc_price_array(newPrice[optIdx],
+                           column('Strike', optIdx), iv,
+                           dte / bs.DAYS_PER_YEAR, column('CP', optIdx))
+
+    quantity = column('Multiplier', slice(None)) * column('Quantity',
+                                                          slice(None))
+    return quantity * (newPrice - theo)
+
+
+def worst_by_priceshock(result):
+    """Smallest total over vol shifts and days forward for each price
+    shock, matching the price risk columns of the MAC report."""
+    return result.totals.min(axis = (1, 2))
+
+
+## Main
+if __name__ == '__main__':
+    script, fileName = sys.argv[:2]
+    gridName = sys.argv[2] if len(sys.argv) > 2 else 'stress'
+    grid     = {'mac' : MAC_GRID, 'stress' : STRESS_GRID}[gridName]
+
+    portfolio, fieldNames, timestamp = mm.getPortfolio(fileName)
+
+    time1  = time.time()
+    result = calc_scenarios(portfolio, grid)
+    time2  = time.time()
+    macRisk = mm.calc_pricerisk_matrix(portfolio, MAC_PRICE_SHOCKS)
+    time3  = time.time()
+
+    print '%d scenarios x %d positions in %0.3f ms (MAC price risk: '\
+          '%d scenarios in %0.3f ms).' % (result.totals.size,
+          portfolio.shape[0], (time2 - time1) * 1000, len(MAC_PRICE_SHOCKS),
+          (time3 - time2) * 1000)
+    print 'Worst loss is %r at price shock %r, vol shift %r, %r days '\
+          'forward.' % ((result.worstLoss,) + result.worstScenario)
+    for shock, loss in zip(grid.priceShocks, worst_by_priceshock(result)):
+        print '%7.3f %20.2f' % (shock, loss)
@@ -6,11 +6,18 @@ Using Cython
 4. A .so file should now exist in the directory
 5. To use the compiled module use: import <module name>
 6. Use the module as you would use any: <module name>.<method name>
+
+The pricing core is compiled straight from _optionpricing_core.py. The built
+extension takes precedence over the .py on import, so the calendar, trading
+and year adapters pick it up automatically and fall back to pure Python when
+it has not been built. optionpricing_kernel.pyx is the typed (C double, GIL
+free) kernel behind the price, greeks and implied vol array functions; the
+core uses its NumPy versions when the kernel is missing.
 """
 
 from distutils.core import setup
 from Cython.Build import cythonize
 
 setup(
-    ext_modules = cythonize("optionpricing_dte.pyx")
+    ext_modules = cythonize(["_optionpricing_core.py", "optionpricing_kernel.pyx"])
 )
\ No newline at end of file
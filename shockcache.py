@@ -0,0 +1,154 @@
+"""
+Bounded cache of per-contract shocked option prices.
+* The price move of one unit of an option under each shock depends only on
+  (Theo_Price, Strike, Implied_Vol, DTE, CP) and the shocks, not on the
+  account or quantity, so accounts holding the same strikes share entries
+* Least recently used contracts are dropped beyond maxSize
+* save/load persist the entries between runs; default_cache_path names the
+  file by date so a new trading day starts cold. Saves from several
+  processes are serialized on a lock file next to the cache file, so none
+  drops the entries of another, and the file is trimmed to maxSize
+* hits, misses and evictions are counted, see stats()
+* Safe to share between threads: lookups and inserts hold a lock, but the
+  repricing of missing contracts in between does not
+"""
+
+
+from __future__ import division
+import os
+import time
+import tempfile
+import threading
+import fcntl
+import cPickle
+import numpy as np
+
+KEY_FIELDS = ['Theo_Price', 'Strike', 'Implied_Vol', 'DTE', 'CP']
+
+
+def default_cache_path(directory = '.', day = None):
+    """shockCache_YYYYMMDD.pkl in directory, for today unless day is given."""
+    if day is None:
+        day = time.strftime('%Y%m%d')
+    return os.path.join(directory, 'shockCache_%s.pkl' % day)
+
+
+class ShockCache(object):
+    """LRU cache of option price moves, one row of len(priceShocks) values
+    per contract. Recency is tracked per price_moves call, and evictions
+    trim the cache to nine tenths of maxSize at a time."""
+    def __init__(self, maxSize = 100000, path = None):
+        self.maxSize   = maxSize
+        self.hits      = 0
+        self.misses    = 0
+        self.evictions = 0
+        self.__entries  = {}
+        self.__lastUsed = {}
+        self.__tick     = 0
+        self.__lock     = threading.Lock()
+        if path is not None and os.path.isfile(path):
+            self.load(path)
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def price_moves(self, options, priceShocks, calc):
+        """Return the price moves of options (rows) under priceShocks (cols).
+        Contracts not in the cache are priced in one call to
+        calc(options, priceShocks) and added."""
+        shocks = np.ascontiguousarray(priceShocks, dtype = float)
+        nRows  = options.shape[0]
+        fields = np.empty((nRows, len(KEY_FIELDS) + shocks.shape[0]))
+        for col, name in enumerate(KEY_FIELDS):
+            fields[:, col] = options[name]
+        fields[:, len(KEY_FIELDS):] = shocks
+        keys = [row.tostring() for row in fields]
+
+        with self.__lock:
+            self.__tick += 1
+            tick    = self.__tick
+            found   = map(self.__entries.get, keys)
+            missing = [row for row in xrange(nRows) if found[row] is None]
+            self.hits   += nRows - len(missing)
+            self.misses += len(missing)
+            self.__lastUsed.update((key, tick) for key, entry 
+                                   in zip(keys, found) if entry is not None)
+
+        moves = np.empty((nRows, shocks.shape[0]))
+        if len(missing) < nRows:
+            hit = np.ones(nRows, dtype = bool)
+            hit[missing] = False
+            moves[hit] = [entry for entry in found if entry is not None]
+        if missing:
+            moves[missing] = calc(options[missing], shocks)
+            with self.__lock:
+                for row in missing:
+                    self.__entries[keys[row]]  = moves[row].copy()
+                    self.__lastUsed[keys[row]] = tick
+                self.__evict()
+        return moves
+
+    def __evict(self):
+        if len(self.__entries) <= self.maxSize:
+            return
+        byAge = sorted(self.__lastUsed, key = self.__lastUsed.get)
+        for key in byAge[:len(byAge) - int(0.9 * self.maxSize)]:
+            del self.__entries[key]
+            del self.__lastUsed[key]
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'Size'      : len(self.__entries),
+                'Hits'      : self.hits,
+                'Misses'    : self.misses,
+                'Evictions' : self.evictions,
+                'Hit_Rate'  : self.hits / lookups if lookups else np.nan}
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.__lastUsed.clear()
+
+    def load(self, path):
+        """Add the entries saved at path; entries already cached win."""
+        with open(path, 'rb') as inFile:
+            saved = cPickle.load(inFile)
+        with self.__lock:
+            for key, entry in saved.iteritems():
+                if key not in self.__entries:
+                    self.__entries[key]  = entry
+                    self.__lastUsed[key] = 0
+            self.__evict()
+
+    def save(self, path):
+        """Save the entries to path, keeping any saved there by another
+        process, up to maxSize entries in all; this cache's most recently
+        used entries come first. Saves hold path + '.lock' from reading the
+        file to replacing it, and the file is replaced in one rename, so a
+        reader never sees it half written."""
+        with self.__lock:
+            byAge = sorted(self.__lastUsed, key = self.__lastUsed.get,
+                           reverse = True)[:self.maxSize]
+            ours  = dict((key, self.__entries[key]) for key in byAge)
+        with open(path + '.lock', 'a') as lockFile:
+            fcntl.flock(lockFile, fcntl.LOCK_EX)
+            try:
+                entries = {}
+                if os.path.isfile(path):
+                    with open(path, 'rb') as inFile:
+                        entries = cPickle.load(inFile)
+                for key, entry in entries.iteritems():
+                    if len(ours) >= self.maxSize:
+                        break
+                    ours.setdefault(key, entry)
+                entries = ours
+
+                directory = os.path.dirname(os.path.abspath(path))
+                fd, tmpPath = tempfile.mkstemp(dir = directory, 
+                                               suffix = '.tmp')
+                with os.fdopen(fd, 'wb') as outFile:
+                    cPickle.dump(entries, outFile, cPickle.HIGHEST_PROTOCOL)
+                os.rename(tmpPath, path)
+            finally:
+                fcntl.flock(lockFile, fcntl.LOCK_UN)